@@ -16,7 +16,7 @@ admin.site.register(WorkLog)
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'full_name', 'phone', 'department', 'designation', 'join_date', 'slug')
-    search_fields = ('user__username', 'full_name')
+    search_fields = ('user__email', 'full_name')
 
 def get_month_attendance_summary(user, month, year):
     total_days = monthrange(year, month)[1]
@@ -62,9 +62,13 @@ def export_attendance_excel(request):
     ws.append(["Date", "Status", "Check In", "Check Out"])
     ws.row_dimensions[1].font = Font(bold=True)
 
+    records = {
+        record.date: record
+        for record in Attendance.objects.filter(user=user, date__year=year, date__month=month)
+    }
     for day in range(1, num_days + 1):
         d = date(year, month, day)
-        record = Attendance.objects.filter(user=user, date=d).first()
+        record = records.get(d)
 
         if record and record.check_in:
             status = "Present"
@@ -82,7 +86,7 @@ def export_attendance_excel(request):
         ws.append([d, status, str(check_in), str(check_out)])
 
     # Prepare response
-    file_name = f"{user.username}_attendance_{month}_{year}.xlsx"
+    file_name = f"{user.get_username()}_attendance_{month}_{year}.xlsx"
 
     response = HttpResponse(content_type="application/ms-excel")
     response['Content-Disposition'] = 'attachment; filename="%s"' % file_name
@@ -103,4 +107,4 @@ class HolidayAdmin(admin.ModelAdmin):
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('title', 'assigned_to', 'created_by', 'status', 'due_date', 'created_at')
     list_filter = ('status', 'assigned_to', 'created_by')
-    search_fields = ('title', 'description', 'assigned_to__username')
\ No newline at end of file
+    search_fields = ('title', 'description', 'assigned_to__email')
\ No newline at end of file
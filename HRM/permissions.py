@@ -1,6 +1,15 @@
 # accounts/permissions.py
 from rest_framework import permissions
 
+
+def is_admin(user):
+    """Superusers and users whose Role is named "Admin" (any case)."""
+    if user.is_superuser:
+        return True
+    role = getattr(user, "role", None)
+    return role is not None and role.name.lower() == "admin"
+
+
 class IsAdmin(permissions.BasePermission):
     """
     Allow only admin role OR superuser to perform write actions.
@@ -10,9 +19,5 @@ class IsAdmin(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Superuser bypasses all restrictions
-        if request.user.is_superuser:
-            return True
-
-        # Only admin role can modify data
-        return request.user.role == "admin"
\ No newline at end of file
+        # Only superusers and the admin role can modify data
+        return is_admin(request.user)
@@ -7,6 +7,12 @@ from accounts.serializers import UserSerializer
 
 User = get_user_model()
 
+
+def display_name(user):
+    """The profile name, else the account's full name, else its email."""
+    profile = getattr(user, "hrm_profile", None)
+    return (profile and profile.full_name) or user.full_name or user.get_username()
+
 # class UserSerializer(serializers.ModelSerializer):
 #     uid = serializers.CharField(read_only=True)
 
@@ -44,12 +50,7 @@ class AttendanceSerializer(serializers.ModelSerializer):
         fields = ['uid', 'user_uid', 'full_name', 'date', 'check_in', 'check_out', 'status', 'working_hours']
 
     def get_full_name(self, obj):
-        profile = obj.user.profile
-        return (
-            profile.full_name or 
-            obj.user.get_full_name() or 
-            obj.user.username
-        )
+        return display_name(obj.user)
 
 
 class AttendanceByDateSerializer(serializers.ModelSerializer):
@@ -61,12 +62,7 @@ class AttendanceByDateSerializer(serializers.ModelSerializer):
         fields = ['user', 'full_name', 'date', 'check_in', 'check_out', 'status', 'working_hours']
 
     def get_full_name(self, obj):
-        profile = obj.user.profile
-        return (
-            profile.full_name or 
-            obj.user.get_full_name() or 
-            obj.user.username
-        )
+        return display_name(obj.user)
 
 class ProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -83,7 +79,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         }
 
 class LeaveSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.username')
+    user = serializers.ReadOnlyField(source='user.email')
 
     class Meta:
         model = Leave
@@ -130,13 +126,13 @@ def get_working_hours(self, obj):
 # accounts/serializers.py (final version – accept username as string)
 
 # -------------------------------------------------
-# TaskSerializer – username only
+# TaskSerializer – assignee by email
 # -------------------------------------------------
 class TaskSerializer(serializers.ModelSerializer):
     assigned_to_name = serializers.SerializerMethodField()
     created_by_name  = serializers.SerializerMethodField()
 
-    # Accept username string in request, but internally map to User object
+    # Accept the staff member's email in request, but internally map to User object
     assigned_to = serializers.CharField(write_only=True)
 
     class Meta:
@@ -147,14 +143,14 @@ class TaskSerializer(serializers.ModelSerializer):
             'created_by_name', 'created_at', 'due_date', 'status'
         ]
 
-    def validate_assigned_to(self, username):
-        username = username.strip()
+    def validate_assigned_to(self, email):
+        email = email.strip()
         try:
-            return User.objects.get(username__iexact=username, role='staff')
+            return User.objects.get(email__iexact=email, role__name__iexact='staff')
         except User.DoesNotExist:
-            available = list(User.objects.filter(role='staff').values_list('username', flat=True))
+            available = list(User.objects.filter(role__name__iexact='staff').values_list('email', flat=True))
             raise serializers.ValidationError(
-                f"Staff user '{username}' not found. Available staff: {available}"
+                f"Staff user '{email}' not found. Available staff: {available}"
             )
 
     def create(self, validated_data):
@@ -164,12 +160,10 @@ class TaskSerializer(serializers.ModelSerializer):
     def get_assigned_to_name(self, obj):
         if not obj.assigned_to:
             return "Unassigned"
-        profile = obj.assigned_to.profile
-        return profile.full_name or obj.assigned_to.get_full_name() or obj.assigned_to.username
+        return display_name(obj.assigned_to)
 
     def get_created_by_name(self, obj):
         if not obj.created_by:
             return "Unknown"
-        profile = obj.created_by.profile
-        return profile.full_name or obj.created_by.get_full_name() or obj.created_by.username
+        return display_name(obj.created_by)
 
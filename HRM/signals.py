@@ -5,18 +5,14 @@ from django.contrib.auth import get_user_model
 from .models import Profile
 from django.utils.text import slugify
 from django.db.models.signals import pre_save
+from MBP.slug_utils import allocate_slug
 import shortuuid
 
 @receiver(pre_save, sender=Profile)
 def generate_slug(sender, instance, **kwargs):
     if not instance.slug:
         base = slugify(instance.full_name or instance.user.username)
-        slug = base
-        i = 1
-        while Profile.objects.filter(slug=slug).exclude(pk=instance.pk).exists():
-            slug = f"{base}-{i}"
-            i += 1
-        instance.slug = slug
+        instance.slug = allocate_slug(Profile, base)
 
 User = get_user_model()
 
@@ -17,10 +17,10 @@ import csv
 from .serializers import UserSerializer
 from .models import Attendance, Profile, Leave, Holiday, Task, WorkLog
 from .serializers import (
-    AttendanceSerializer, AttendanceByDateSerializer,
+    AttendanceSerializer, AttendanceByDateSerializer, display_name,
     ProfileSerializer, LeaveSerializer, HolidaySerializer, TaskSerializer
 )
-from .permissions import IsAdmin
+from .permissions import IsAdmin, is_admin
 
 User = get_user_model()
 
@@ -123,7 +123,7 @@ def check_out(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def my_attendance(request):
-    data = Attendance.objects.filter(user=request.user).order_by('-date')
+    data = Attendance.objects.filter(user=request.user).select_related('user__hrm_profile').order_by('-date')
     serializer = AttendanceSerializer(data, many=True)
     return Response(serializer.data)
 
@@ -134,10 +134,10 @@ def my_attendance(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def all_attendance(request):
-    if not request.user.is_superuser and request.user.role != "admin":
+    if not is_admin(request.user):
         return Response({"error": "Admin access required"}, status=403)
 
-    data = Attendance.objects.all().order_by('-date')
+    data = Attendance.objects.select_related('user__hrm_profile').order_by('-date')
     serializer = AttendanceSerializer(data, many=True)
     return Response(serializer.data)
 
@@ -157,7 +157,7 @@ def attendance_by_date(request):
     except ValueError:
         return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
 
-    records = Attendance.objects.filter(date=query_date)
+    records = Attendance.objects.filter(date=query_date).select_related('user__hrm_profile')
     serializer = AttendanceByDateSerializer(records, many=True)
     return Response(serializer.data)
 
@@ -178,7 +178,7 @@ def present_absent_by_date(request):
         return Response({"error": "Invalid date format"}, status=400)
 
     present = Attendance.objects.filter(date=query_date, check_in__isnull=False).count()
-    total_staff = User.objects.filter(role='staff').count()
+    total_staff = User.objects.filter(role__name__iexact='staff').count()
     absent = total_staff - present
 
     return Response({
@@ -200,7 +200,7 @@ def attendance_month(request):
         return Response({"error": "month=YYYY-MM required"}, status=400)
 
     year, month = map(int, month.split('-'))
-    records = Attendance.objects.filter(date__year=year, date__month=month)
+    records = Attendance.objects.filter(date__year=year, date__month=month).select_related('user__hrm_profile')
     serializer = AttendanceSerializer(records, many=True)
     return Response(serializer.data)
 
@@ -239,44 +239,43 @@ def monthly_summary(request):
         date__month=month_num
     ).count()
 
-    summary = []
-    for user in User.objects.filter(role='staff'):
-        # Count present days (has check_in)
-        present = Attendance.objects.filter(
-            user=user,
-            date__year=year,
-            date__month=month_num,
-            check_in__isnull=False
-        ).count()
-
-        # Count approved leaves for this user
-        approved_leaves = Leave.objects.filter(
-            user=user,
-            date__year=year,
-            date__month=month_num,
-            status='Approved'
-        ).count()
+    # One query for every staff member's counts; Count(distinct=True)
+    # because the attendance and leave joins multiply each other's rows
+    staff = User.objects.filter(role__name__iexact='staff').select_related('hrm_profile').annotate(
+        present=Count(
+            'accounts_attendance',
+            filter=Q(
+                accounts_attendance__date__year=year,
+                accounts_attendance__date__month=month_num,
+                accounts_attendance__check_in__isnull=False,
+            ),
+            distinct=True,
+        ),
+        approved_leaves=Count(
+            'leave',
+            filter=Q(leave__date__year=year, leave__date__month=month_num, leave__status='Approved'),
+            distinct=True,
+        ),
+    )
 
+    summary = []
+    for user in staff:
         # Calculate actual workdays
-        workdays = eligible_days - holidays_count - approved_leaves
+        workdays = eligible_days - holidays_count - user.approved_leaves
         workdays = max(workdays, 0)  # safety
 
         # Absent = workdays - present
-        absent = max(workdays - present, 0)
-
-        # Get full name
-        profile = user.profile
-        full_name = profile.full_name or user.get_full_name() or user.username
+        absent = max(workdays - user.present, 0)
 
         summary.append({
-            "user": user.username,
-            "full_name": full_name,
-            "present": present,
+            "user": user.get_username(),
+            "full_name": display_name(user),
+            "present": user.present,
             "absent": absent,
             "workdays": workdays,
             "eligible_days": eligible_days,
             "holidays": holidays_count,
-            "approved_leaves": approved_leaves
+            "approved_leaves": user.approved_leaves
         })
 
     return Response(summary)
@@ -292,16 +291,16 @@ def live_status(request):
         date=today,
         check_in__isnull=False,
         check_out__isnull=True
-    ).select_related('user__profile')
+    ).select_related('user__hrm_profile')
 
     data = []
     for record in in_office:
-        profile = record.user.profile
+        profile = getattr(record.user, 'hrm_profile', None)
         data.append({
-            "username": record.user.username,
-            "full_name": profile.full_name or record.user.username,
+            "username": record.user.get_username(),
+            "full_name": display_name(record.user),
             "check_in": record.check_in.strftime("%H:%M"),
-            "slug": profile.slug
+            "slug": profile.slug if profile else None
         })
 
     return Response({"in_office": data})
@@ -329,18 +328,22 @@ def export_monthly_report(request):
         cell.font = Font(bold=True)
 
     days_in_month = monthrange(year, month_num)[1]
-    for user in User.objects.filter(role='staff'):
-        present = Attendance.objects.filter(
-            user=user, date__year=year, date__month=month_num, check_in__isnull=False
-        ).count()
-        absent = days_in_month - present
-
-        profile = user.profile
+    staff = User.objects.filter(role__name__iexact='staff').select_related('hrm_profile').annotate(
+        present=Count(
+            'accounts_attendance',
+            filter=Q(
+                accounts_attendance__date__year=year,
+                accounts_attendance__date__month=month_num,
+                accounts_attendance__check_in__isnull=False,
+            ),
+        ),
+    )
+    for user in staff:
         ws.append([
-            user.username,
-            profile.full_name or user.get_full_name() or user.username,
-            present,
-            absent,
+            user.get_username(),
+            display_name(user),
+            user.present,
+            days_in_month - user.present,
             days_in_month
         ])
 
@@ -364,8 +367,8 @@ def dashboard(request):
     # ------------------------------------------------------------------
     # 1. Totals
     # ------------------------------------------------------------------
-    total_staff = User.objects.filter(role='staff').count()
-    total_admins = User.objects.filter(role='admin').count()
+    total_staff = User.objects.filter(role__name__iexact='staff').count()
+    total_admins = User.objects.filter(role__name__iexact='admin').count()
 
     # ------------------------------------------------------------------
     # 2. Today’s Attendance
@@ -393,8 +396,9 @@ def dashboard(request):
     # ------------------------------------------------------------------
     # 5. Holidays
     # ------------------------------------------------------------------
-    is_holiday = Holiday.objects.filter(date=today).exists()
-    holiday_name = Holiday.objects.filter(date=today).first().name if is_holiday else None
+    holiday = Holiday.objects.filter(date=today).first()
+    is_holiday = holiday is not None
+    holiday_name = holiday.name if is_holiday else None
 
     # ------------------------------------------------------------------
     # 6. Current Month Summary (up to today)
@@ -424,11 +428,11 @@ def dashboard(request):
     recent_checkins = Attendance.objects.filter(
         date=today,
         check_in__gte=five_mins_ago
-    ).select_related('user__profile').order_by('-check_in')[:5]
+    ).select_related('user__hrm_profile').order_by('-check_in')[:5]
 
     live_checkins = [
         {
-            "name": a.user.profile.full_name or a.user.username,
+            "name": display_name(a.user),
             "time": a.check_in.strftime("%I:%M %p")
         }
         for a in recent_checkins
@@ -470,7 +474,7 @@ def dashboard(request):
     }
 
     # Optional: Admin-only stats
-    if request.user.role == 'admin' or request.user.is_superuser:
+    if is_admin(request.user):
         data["admin_insights"] = {
             "pending_leaves": Leave.objects.filter(status='Pending').count(),
             "overtime_today": Attendance.objects.filter(
@@ -502,7 +506,7 @@ def request_leave(request):
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def update_leave_status(request, leave_id):
-    if not request.user.is_superuser and request.user.role != "admin":
+    if not is_admin(request.user):
         return Response({"error": "Admin only"}, status=403)
 
     try:
@@ -522,7 +526,7 @@ def update_leave_status(request, leave_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_holiday(request):
-    if not request.user.is_superuser and request.user.role != "admin":
+    if not is_admin(request.user):
         return Response({"error": "Admin only"}, status=403)
 
     serializer = HolidaySerializer(data=request.data)
@@ -536,7 +540,7 @@ def create_holiday(request):
 # 12. PROFILE BY SLUG
 # ————————————————————————————————————————
 class ProfileDetailBySlug(generics.RetrieveUpdateAPIView):
-    queryset = Profile.objects.all()
+    queryset = Profile.objects.select_related('user__role', 'user__created_by')
     serializer_class = ProfileSerializer
     lookup_field = 'slug'
     permission_classes = [IsAuthenticated]
@@ -562,10 +566,10 @@ def register_user(request):
             "message": "User created successfully",
             "user": {
                 "uid": user.uid,
-                "username": user.username,
+                "username": user.get_username(),
                 "email": user.email,
-                "role": user.role,
-                "slug": user.profile.slug
+                "role": user.role.name if user.role else None,
+                "slug": user.hrm_profile.slug
             }
         }, status=201)
 
@@ -614,7 +618,7 @@ def delete_user(request, user_uid, uid):
     # OPTION B (Recommended): Store a `delete_code` in Profile
     # Let's implement it safely below
     try:
-        profile = user.profile
+        profile = user.hrm_profile
         if not hasattr(profile, 'delete_code') or profile.delete_code != uid:
             return Response(
                 {"error": "Invalid confirmation code. Both IDs required."},
@@ -632,7 +636,7 @@ def delete_user(request, user_uid, uid):
     if user.is_superuser:
         return Response({"error": "Cannot delete superuser"}, status=400)
 
-    username = user.username
+    username = user.get_username()
     user.delete()  # Deletes user + profile + all attendance
 
     return Response({
@@ -670,7 +674,9 @@ def create_task(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def my_tasks(request):
-    tasks = Task.objects.filter(assigned_to=request.user).order_by('-created_at')
+    tasks = Task.objects.filter(assigned_to=request.user).select_related(
+        'assigned_to__hrm_profile', 'created_by__hrm_profile'
+    ).order_by('-created_at')
     serializer = TaskSerializer(tasks, many=True)
     return Response(serializer.data)
 
@@ -681,7 +687,9 @@ def my_tasks(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdmin])
 def all_tasks(request):
-    tasks = Task.objects.all().order_by('-created_at')
+    tasks = Task.objects.select_related(
+        'assigned_to__hrm_profile', 'created_by__hrm_profile'
+    ).order_by('-created_at')
     serializer = TaskSerializer(tasks, many=True)
     return Response(serializer.data)
 
@@ -698,7 +706,7 @@ def update_task_status(request, task_uid):
         return Response({"error": "Task not found"}, status=status.HTTP_404_NOT_FOUND)
 
     # Only assigned user or admin can update
-    if task.assigned_to != request.user and not (request.user.is_superuser or request.user.role == "admin"):
+    if task.assigned_to != request.user and not is_admin(request.user):
         return Response({"error": "Permission denied"}, status=status.HTTP_403_FORBIDDEN)
 
     status_val = request.data.get('status')
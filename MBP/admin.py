@@ -1,9 +1,9 @@
 from django.contrib import admin
-from .models import Role, AppModel, PermissionType, RoleModelPermission, AuditLog
+from .models import Role, AppModel, PermissionType, RoleModelPermission, RolePermissionMatrix, AuditLog, AuditLogRollup
 
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug', 'description')
+    list_display = ('name', 'slug', 'parent', 'description')
     prepopulated_fields = {"slug": ("name",)}
     search_fields = ('name',)
 
@@ -33,9 +33,23 @@ class RoleModelPermissionAdmin(admin.ModelAdmin):
     def permission_name(self, obj):
         return obj.permission_type.name
 
+@admin.register(RolePermissionMatrix)
+class RolePermissionMatrixAdmin(admin.ModelAdmin):
+    list_display = ('role', 'model', 'mask', 'effective_mask')
+    list_filter = ('role',)
+    search_fields = ('role__name', 'model__name')
+    readonly_fields = ('role', 'model', 'mask', 'effective_mask')
+
 @admin.register(AuditLog)
 class AuditLogAdmin(admin.ModelAdmin):
     list_display = ['timestamp', 'user', 'action', 'model_name', 'object_id']
     search_fields = ['user__email', 'action', 'model_name', 'details']
     list_filter = ['action', 'model_name', 'timestamp']
-    readonly_fields = [field.name for field in AuditLog._meta.fields]
\ No newline at end of file
+    readonly_fields = [field.name for field in AuditLog._meta.fields]
+
+
+@admin.register(AuditLogRollup)
+class AuditLogRollupAdmin(admin.ModelAdmin):
+    list_display = ['bucket', 'granularity', 'action', 'model_name', 'user', 'count']
+    list_filter = ['granularity', 'action', 'model_name']
+    readonly_fields = [field.name for field in AuditLogRollup._meta.fields]
@@ -0,0 +1,69 @@
+"""
+Keeps the AppModel table in step with the installed Django models.
+
+``sync_app_models`` reads every AppModel row in one query, diffs it against
+``apps.get_models()`` and applies inserts, metadata updates and (optionally)
+stale removals in bulk, so it is cheap enough to run on every deploy or worker
+start.
+"""
+from django.apps import apps
+from django.db import transaction
+from django.utils.text import slugify
+
+from .models import AppModel
+from .permission_utils import deferred_matrix_sync
+from .slug_utils import allocate_slugs
+
+
+def installed_models():
+    """``{name: (app_label, verbose_name)}`` for every installed model."""
+    return {
+        model.__name__: (model._meta.app_label, model._meta.verbose_name.title())
+        for model in apps.get_models()
+    }
+
+
+def sync_app_models(prune=False):
+    """
+    Diff AppModel against the installed models. Rows whose app label or
+    verbose name drifted are updated in place; rows for models that no longer
+    exist are only deleted with ``prune``, since that cascades to their grants.
+    Returns the ``{"added", "updated", "stale", "removed"}`` model names.
+    """
+    wanted = installed_models()
+
+    with transaction.atomic(), deferred_matrix_sync():
+        existing = {row.name: row for row in AppModel.objects.all()}
+
+        new_names = [name for name in wanted if name not in existing]
+        slugs = allocate_slugs(AppModel, [slugify(f"{wanted[name][0]}-{name}") for name in new_names])
+        added = AppModel.objects.bulk_create([
+            AppModel(
+                name=name,
+                slug=slug,
+                verbose_name=wanted[name][1],
+                app_label=wanted[name][0],
+                description=f"Auto-added model: {wanted[name][1]}",
+            )
+            for name, slug in zip(new_names, slugs)
+        ])
+
+        changed = []
+        for name, row in existing.items():
+            if name in wanted and (row.app_label, row.verbose_name) != wanted[name]:
+                row.app_label, row.verbose_name = wanted[name]
+                changed.append(row)
+        if changed:
+            AppModel.objects.bulk_update(changed, ["app_label", "verbose_name"])
+
+        stale = [name for name in existing if name not in wanted]
+        if prune and stale:
+            AppModel.objects.filter(name__in=stale).delete()
+
+    return {
+        "added": new_names,
+        "updated": [row.name for row in changed],
+        "stale": stale,
+        "removed": stale if prune else [],
+    }
+
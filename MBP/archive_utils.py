@@ -0,0 +1,248 @@
+"""
+Cold storage for old AuditLog rows.
+
+``archive_audit_logs`` moves rows older than ``AUDIT_LOG_RETENTION_DAYS``
+out of the database into one gzip-compressed JSON-lines file per calendar
+month under ``AUDIT_LOG_ARCHIVE_DIR``, next to a ``manifest.json`` that
+records each partition's row count and its timestamp and id ranges. A
+partition is rewritten (old lines plus new rows, de-duplicated by id) and
+swapped into place before the rows are deleted, so an interrupted run never
+loses rows; at worst a row is briefly in both places, and readers prefer
+the database copy.
+
+``archived_rows`` and ``find_archived`` read partitions back. They consult
+the manifest first and only open the partitions a query's time range or id
+actually needs.
+"""
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditLog
+
+
+MANIFEST_NAME = "manifest.json"
+
+_lock = threading.Lock()
+_manifest_cache = {}  # path -> (mtime_ns, manifest)
+
+
+def archive_dir():
+    return Path(getattr(settings, "AUDIT_LOG_ARCHIVE_DIR", Path(settings.BASE_DIR) / "audit_archive"))
+
+
+def _fields():
+    return [field.attname for field in AuditLog._meta.concrete_fields]
+
+
+def _month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(moment):
+    return _month_start(_month_start(moment) + timedelta(days=32))
+
+
+def _empty_manifest():
+    return {"archived_before": None, "partitions": {}}
+
+
+def load_manifest(directory=None):
+    path = (directory or archive_dir()) / MANIFEST_NAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return _empty_manifest()
+
+    cached = _manifest_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    with _lock:
+        _manifest_cache[path] = (mtime, manifest)
+    return manifest
+
+
+def _save_manifest(directory, manifest):
+    path = directory / MANIFEST_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _write_partition(directory, manifest, key, rows):
+    """
+    Merge ``rows`` into the month's partition. Returns the archived ids.
+    """
+    path = directory / f"auditlog-{key}.jsonl.gz"
+    tmp = path.with_name(path.name + ".tmp")
+    ids = set()
+    stats = {"rows": 0, "first": None, "last": None, "min_id": None, "max_id": None}
+
+    def track(row_id, stamp):
+        stats["rows"] += 1
+        stats["first"] = stamp if stats["first"] is None else min(stats["first"], stamp)
+        stats["last"] = stamp if stats["last"] is None else max(stats["last"], stamp)
+        stats["min_id"] = row_id if stats["min_id"] is None else min(stats["min_id"], row_id)
+        stats["max_id"] = row_id if stats["max_id"] is None else max(stats["max_id"], row_id)
+
+    with gzip.open(tmp, "wt", encoding="utf-8") as out:
+        for row in rows:
+            ids.add(row["id"])
+            track(row["id"], row["timestamp"])
+            out.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+
+        if path.exists():
+            with gzip.open(path, "rt", encoding="utf-8") as existing:
+                for line in existing:
+                    row = json.loads(line)
+                    if row["id"] in ids:
+                        continue
+                    track(row["id"], parse_datetime(row["timestamp"]))
+                    out.write(line)
+
+    if not ids:
+        tmp.unlink()
+        return ids
+
+    os.replace(tmp, path)
+    manifest["partitions"][key] = {
+        "file": path.name,
+        "rows": stats["rows"],
+        "first": stats["first"].isoformat(),
+        "last": stats["last"].isoformat(),
+        "min_id": stats["min_id"],
+        "max_id": stats["max_id"],
+    }
+    return ids
+
+
+def archive_audit_logs(older_than_days=None, directory=None, now=None, delete_batch=5000):
+    """
+    Archive rows with ``timestamp`` older than the retention age, one month
+    at a time. Returns ``{"YYYY-MM": rows archived}``.
+    """
+    if older_than_days is None:
+        older_than_days = settings.AUDIT_LOG_RETENTION_DAYS
+    directory = directory or archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    cutoff = (now or timezone.now()) - timedelta(days=older_than_days)
+
+    manifest = json.loads(json.dumps(load_manifest(directory)))  # private copy
+    fields = _fields()
+    old_rows = AuditLog.objects.filter(timestamp__lt=cutoff)
+    archived = {}
+
+    for month in old_rows.dates("timestamp", "month"):
+        start = _month_start(timezone.make_aware(datetime(month.year, month.month, 1)))
+        end = min(_next_month(start), cutoff)
+        rows = old_rows.filter(timestamp__gte=start, timestamp__lt=end).order_by("pk").values(*fields)
+
+        key = start.strftime("%Y-%m")
+        ids = _write_partition(directory, manifest, key, rows.iterator(chunk_size=2000))
+        if not ids:
+            continue
+        _save_manifest(directory, manifest)
+
+        ids = sorted(ids)
+        for i in range(0, len(ids), delete_batch):
+            with transaction.atomic():
+                AuditLog.objects.filter(pk__in=ids[i:i + delete_batch]).delete()
+        archived[key] = len(ids)
+
+    previous = manifest.get("archived_before")
+    if previous is None or parse_datetime(previous) < cutoff:
+        manifest["archived_before"] = cutoff.isoformat()
+        _save_manifest(directory, manifest)
+    return archived
+
+
+def _to_instance(row):
+    row["timestamp"] = parse_datetime(row["timestamp"])
+    entry = AuditLog(**row)
+    entry._state.adding = False
+    return entry
+
+
+def _read_partition(directory, partition):
+    with gzip.open(directory / partition["file"], "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+def archived_horizon(directory=None):
+    """Rows before this moment may live in the archive (None: nothing archived)."""
+    value = load_manifest(directory).get("archived_before")
+    return parse_datetime(value) if value else None
+
+
+def archived_rows(since=None, until=None, before=None, match=None, limit=None, directory=None):
+    """
+    Archived AuditLog rows (unsaved instances) newest first, restricted to
+    ``since <= timestamp < until``, to keyset positions older than
+    ``before = (timestamp, id)`` and to rows for which ``match(row_dict)``
+    holds. Partitions outside the range are never opened, and reading stops
+    once ``limit`` rows are certain.
+    """
+    directory = directory or archive_dir()
+    partitions = load_manifest(directory)["partitions"]
+    found = []
+
+    for key in sorted(partitions, reverse=True):
+        partition = partitions[key]
+        first, last = parse_datetime(partition["first"]), parse_datetime(partition["last"])
+        if until is not None and first >= until:
+            continue
+        if before is not None and first > before[0]:
+            continue
+        if since is not None and last < since:
+            break
+        if limit is not None and len(found) >= limit:
+            # Partitions are month ranges: older ones cannot beat what we have
+            break
+
+        for row in _read_partition(directory, partition):
+            stamp = parse_datetime(row["timestamp"])
+            if since is not None and stamp < since:
+                continue
+            if until is not None and stamp >= until:
+                continue
+            if before is not None and (stamp, row["id"]) >= before:
+                continue
+            if match is not None and not match(row):
+                continue
+            found.append(row)
+
+    found.sort(key=lambda row: (parse_datetime(row["timestamp"]), row["id"]), reverse=True)
+    if limit is not None:
+        found = found[:limit]
+    return [_to_instance(row) for row in found]
+
+
+def find_archived(pk, directory=None):
+    directory = directory or archive_dir()
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+
+    for partition in load_manifest(directory)["partitions"].values():
+        if not partition["min_id"] <= pk <= partition["max_id"]:
+            continue
+        for row in _read_partition(directory, partition):
+            if row["id"] == pk:
+                return _to_instance(row)
+    return None
@@ -0,0 +1,426 @@
+"""
+Buffered AuditLog writer.
+
+``log_audit`` and the audit signals hand their rows to ``audit_writer``
+instead of inserting them inside the request. Rows are queued in process and
+written with ``bulk_create`` by a background thread once
+``AUDIT_LOG_BATCH_SIZE`` rows are waiting or ``AUDIT_LOG_FLUSH_INTERVAL``
+seconds have passed, and whatever is still queued is flushed at interpreter
+exit. Rows are only queued once the surrounding transaction commits, so a
+rolled-back request leaves no audit trail, as before. Each flush also adds
+its rows to the hourly and daily AuditLogRollup counters.
+
+With ``AUDIT_LOG_ASYNC = False`` (``AUDIT_LOG_ASYNC=0`` in the environment)
+rows are inserted synchronously, in the caller's transaction, and reach the
+live feed once it commits.
+
+Update audits in ``AUDIT_LOG_UPDATE_MODE = "diff"`` (the default is
+``"full"``) keep only the changed fields (``AuditLog.changes``);
+``audit_states`` rebuilds the full before and after snapshots on read from
+the object's other audit entries. Only the log detail view does that, so
+listings and exports carry ``changes`` with null snapshots in that mode.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, deque
+from datetime import timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, models, transaction
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+
+from .models import AuditLog, AuditLogRollup
+
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    def __init__(self, batch_size=None, flush_interval=None):
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = deque()
+        self._wakeup = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+    @property
+    def batch_size(self):
+        return self._batch_size or getattr(settings, "AUDIT_LOG_BATCH_SIZE", 100)
+
+    @property
+    def flush_interval(self):
+        return self._flush_interval or getattr(settings, "AUDIT_LOG_FLUSH_INTERVAL", 1.0)
+
+    def submit(self, entry):
+        """Queue an unsaved AuditLog; written once the current transaction commits."""
+        if not getattr(settings, "AUDIT_LOG_ASYNC", True):
+            # Written inside the caller's transaction; only announced once it
+            # commits, so a rolled-back change never reaches the feed
+            written = self._write([entry])
+            transaction.on_commit(lambda: audit_feed.publish(written))
+            return
+        transaction.on_commit(lambda: self._enqueue(entry))
+
+    def _enqueue(self, entry):
+        self._ensure_thread()
+        with self._wakeup:
+            self._queue.append(entry)
+            backlog = len(self._queue)
+            if backlog >= self.batch_size:
+                self._wakeup.notify()
+
+        # The thread cannot keep up (e.g. the database is slow): write in the
+        # caller rather than letting the queue grow without bound.
+        if backlog >= self.batch_size * 10:
+            self.flush()
+
+    def _ensure_thread(self):
+        # A forked worker inherits the queue but not the thread
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._wakeup:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                if not self._stopping and len(self._queue) < self.batch_size:
+                    self._wakeup.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            close_old_connections()
+            if stopping:
+                return
+
+    def _drain(self):
+        with self._wakeup:
+            batch = list(self._queue)
+            self._queue.clear()
+        return batch
+
+    def flush(self):
+        """Write every queued row now; returns how many were written."""
+        with self._flush_lock:
+            batch = self._drain()
+            if batch:
+                audit_feed.publish(self._write(batch))
+            return len(batch)
+
+    def _write(self, batch):
+        """Insert the batch and count it into the rollups; returns the rows written."""
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(batch, batch_size=self.batch_size)
+                update_rollups(batch)
+            return batch
+        except Exception:
+            logger.exception("Failed to bulk write %d audit logs; retrying one by one", len(batch))
+
+        # One bad row (e.g. its user was deleted meanwhile) must not cost
+        # the rest of the batch.
+        written = []
+        for entry in batch:
+            try:
+                with transaction.atomic():
+                    entry.save(force_insert=True)
+                written.append(entry)
+            except Exception:
+                logger.exception("Failed to write audit log for %s %s", entry.action, entry.model_name)
+        try:
+            update_rollups(written)
+        except Exception:
+            logger.exception("Failed to update audit rollups")
+        return written
+
+    def close(self):
+        """Stop the background thread and flush what is left."""
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            with self._wakeup:
+                self._stopping = True
+                self._wakeup.notify()
+            thread.join(timeout=10)
+        self.flush()
+
+    def pending(self):
+        return len(self._queue)
+
+
+class AuditFeed:
+    """
+    The last ``AUDIT_FEED_SIZE`` audit events written by this process, newest
+    last, for the recent-activity widget. Each event gets a sequence number
+    so listeners can wait for, or resume after, a given one. On first read
+    the buffer is primed from the database once.
+
+    Events written by other worker processes never reach this buffer, so
+    the live SSE feed reads the table and only waits on the buffer to wake
+    early.
+    """
+
+    def __init__(self, size=None):
+        self._size = size
+        self._events = None
+        self._seq = 0
+        self._changed = threading.Condition()
+        self._primed = False
+
+    def _buffer(self):
+        if self._events is None:
+            self._events = deque(maxlen=self._size or getattr(settings, "AUDIT_FEED_SIZE", 500))
+        return self._events
+
+    @staticmethod
+    def _event(entry, seq):
+        # Only a user instance already attached to the entry is read, so
+        # publishing never queries.
+        user = entry.user if AuditLog.user.is_cached(entry) else None
+        event = {
+            "seq": seq,
+            "id": entry.pk,
+            "action": entry.action,
+            "model_name": entry.model_name,
+            "object_id": entry.object_id,
+            "details": entry.details or "",
+            "user": user.full_name if user else None,
+            "user_id": str(entry.user_id) if entry.user_id else None,
+            "timestamp": entry.timestamp,
+        }
+        # Kept next to the event for visibility checks, not sent to clients
+        return event, entry.user_id, getattr(user, "created_by_id", None)
+
+    def publish(self, entries):
+        with self._changed:
+            events = self._buffer()
+            for entry in entries:
+                self._seq += 1
+                events.append(self._event(entry, self._seq))
+            self._changed.notify_all()
+
+    def prime(self):
+        """Fill the buffer with the newest stored rows once per process."""
+        if self._primed:
+            return
+        size = self._buffer().maxlen
+        rows = list(AuditLog.objects.select_related("user").order_by("-timestamp", "-id")[:size])
+        with self._changed:
+            if not self._primed:
+                known = {event["id"] for event, _, _ in self._events}
+                room = size - len(self._events)
+                # Primed history has seq 0: shown by recent(), never replayed
+                older = [self._event(row, 0) for row in rows if row.pk not in known][:room]
+                self._events.extendleft(older)
+                self._primed = True
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def _visible(self, viewer):
+        if viewer is None or viewer.is_superuser:
+            return lambda user_id, created_by_id: True
+        return lambda user_id, created_by_id: user_id == viewer.pk or created_by_id == viewer.pk
+
+    def recent(self, limit, viewer=None):
+        """The newest ``limit`` events ``viewer`` may see, newest first."""
+        self.prime()
+        visible = self._visible(viewer)
+        with self._changed:
+            events = list(self._buffer())
+        found = []
+        for event, user_id, created_by_id in reversed(events):
+            if visible(user_id, created_by_id):
+                found.append(event)
+                if len(found) == limit:
+                    break
+        return found
+
+    def wait(self, after_seq, timeout, viewer=None):
+        """
+        Wait up to ``timeout`` seconds for events newer than ``after_seq``.
+        Returns those ``viewer`` may see (oldest first) and the sequence
+        number to wait after next time.
+        """
+        visible = self._visible(viewer)
+        with self._changed:
+            self._changed.wait_for(lambda: self._seq > after_seq, timeout)
+            events, seq = list(self._buffer()), self._seq
+        return [
+            event for event, user_id, created_by_id in events
+            if event["seq"] > after_seq and visible(user_id, created_by_id)
+        ], seq
+
+
+audit_feed = AuditFeed()
+audit_writer = AuditLogWriter()
+atexit.register(audit_writer.close)
+
+
+def flush_audit_logs():
+    return audit_writer.flush()
+
+
+def rollup_buckets(moment):
+    """``{granularity: bucket start}`` for a timestamp, in UTC."""
+    hour = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return {
+        AuditLogRollup.HOUR: hour,
+        AuditLogRollup.DAY: hour.replace(hour=0),
+    }
+
+
+def update_rollups(entries):
+    """
+    Add freshly written audit rows to their hourly and daily AuditLogRollup
+    buckets: one read of the touched buckets, then one bulk update and one
+    bulk insert.
+    """
+    counts = Counter()
+    for entry in entries:
+        for granularity, bucket in rollup_buckets(entry.timestamp).items():
+            counts[(granularity, bucket, entry.action, entry.model_name or '', entry.user_id)] += 1
+    if not counts:
+        return
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                _apply_rollup_counts(counts)
+            return
+        except IntegrityError:
+            # Another writer created one of the buckets first; it exists now
+            if attempt:
+                raise
+
+
+def _apply_rollup_counts(counts):
+    existing = AuditLogRollup.objects.select_for_update().filter(
+        bucket__in={key[1] for key in counts},
+        action__in={key[2] for key in counts},
+    )
+    rows = {}
+    for row in existing:
+        rows.setdefault((row.granularity, row.bucket, row.action, row.model_name, row.user_id), row)
+
+    changed, created = [], []
+    for key, count in counts.items():
+        row = rows.get(key)
+        if row is not None:
+            row.count += count
+            changed.append(row)
+        else:
+            granularity, bucket, action, model_name, user_id = key
+            created.append(AuditLogRollup(
+                granularity=granularity, bucket=bucket, action=action,
+                model_name=model_name, user_id=user_id, count=count,
+            ))
+    if changed:
+        AuditLogRollup.objects.bulk_update(changed, ["count"])
+    if created:
+        AuditLogRollup.objects.bulk_create(created)
+
+
+def rebuild_rollups(start, end):
+    """
+    Recount the AuditLogRollup buckets of the UTC days from ``start`` to
+    ``end`` from the AuditLog rows, for rows that were written without the
+    audit writer (e.g. a CSV import).
+    """
+    first = rollup_buckets(start)[AuditLogRollup.DAY]
+    last = rollup_buckets(end)[AuditLogRollup.DAY] + timedelta(days=1)
+    logs = AuditLog.objects.filter(timestamp__gte=first, timestamp__lt=last)
+
+    with transaction.atomic():
+        AuditLogRollup.objects.filter(bucket__gte=first, bucket__lt=last).delete()
+        for granularity, trunc in [(AuditLogRollup.HOUR, TruncHour), (AuditLogRollup.DAY, TruncDay)]:
+            rows = (
+                logs.annotate(
+                    bucket=trunc("timestamp", tzinfo=dt_timezone.utc),
+                    model=Coalesce("model_name", models.Value("")),
+                )
+                .values("bucket", "action", "model", "user_id")
+                .annotate(total=models.Count("id"))
+                .order_by()
+            )
+            AuditLogRollup.objects.bulk_create(
+                (
+                    AuditLogRollup(
+                        granularity=granularity, bucket=row["bucket"], action=row["action"],
+                        model_name=row["model"], user_id=row["user_id"], count=row["total"],
+                    )
+                    for row in rows.iterator()
+                ),
+                batch_size=1000,
+            )
+
+
+def diff_snapshots(old, new):
+    """``{field: [old, new]}`` for every field whose serialized value changed."""
+    return {
+        field: [old.get(field), value]
+        for field, value in new.items()
+        if old.get(field) != value
+    }
+
+
+def _live_snapshot(model_name, object_id):
+    from .utils import serialize_instance
+
+    for model in apps.get_models():
+        if model.__name__ == model_name:
+            instance = model._default_manager.filter(pk=object_id).first()
+            return serialize_instance(instance) if instance is not None else None
+    return None
+
+
+def audit_states(entry):
+    """
+    The full ``(before, after)`` snapshots of an audit entry. For diff-mode
+    updates they are replayed from the nearest earlier full snapshot (the
+    create, or a full-mode update), or else rewound from the nearest later
+    one (a delete's old_data, or the live row).
+    """
+    if entry.changes is None:
+        return entry.old_data, entry.new_data
+
+    history = AuditLog.objects.filter(model_name=entry.model_name, object_id=entry.object_id)
+
+    base = history.filter(pk__lt=entry.pk, new_data__isnull=False).order_by("-pk").first()
+    if base is not None:
+        state = dict(base.new_data)
+        for changes in history.filter(pk__gt=base.pk, pk__lt=entry.pk, changes__isnull=False).order_by(
+            "pk"
+        ).values_list("changes", flat=True):
+            state.update((field, pair[1]) for field, pair in changes.items())
+        before = state
+    else:
+        later = history.filter(pk__gt=entry.pk, old_data__isnull=False).order_by("pk").first()
+        state = dict(later.old_data) if later else _live_snapshot(entry.model_name, entry.object_id)
+        if state is None:
+            # Nothing to anchor on: only the changed fields are known
+            return (
+                {field: pair[0] for field, pair in entry.changes.items()},
+                {field: pair[1] for field, pair in entry.changes.items()},
+            )
+        newer = history.filter(pk__gt=entry.pk, changes__isnull=False)
+        if later:
+            newer = newer.filter(pk__lt=later.pk)
+        for changes in newer.order_by("-pk").values_list("changes", flat=True):
+            state.update((field, pair[0]) for field, pair in changes.items())
+        state.update((field, pair[0]) for field, pair in entry.changes.items())
+        before = state
+
+    after = dict(before)
+    after.update((field, pair[1]) for field, pair in entry.changes.items())
+    return before, after
@@ -0,0 +1,772 @@
+"""
+CSV export and import of whole models.
+
+``export_models`` writes one ``<app_label>_<Model>.csv`` per model. Rows are
+streamed with ``values_list(...).iterator()`` straight into the file, so no
+model instances are built and memory stays flat however large the table.
+Foreign keys are written as their raw key (the ``user_id`` column, not
+``str(user)``), JSON fields as JSON, everything else as ``str(value)``.
+
+``export_delta`` writes only the rows the AuditLog says were created,
+updated or deleted after a watermark (an AuditLog id), plus tombstones for
+the deleted ones, for incremental syncs.
+
+All models are read from one snapshot, so the files agree with each other
+(no Attendance row pointing at a User that was created after the User file
+was written):
+
+* on PostgreSQL the coordinator opens a REPEATABLE READ transaction and
+  exports its snapshot with ``pg_export_snapshot()``; every worker thread
+  attaches to it with ``SET TRANSACTION SNAPSHOT``, so models are exported in
+  parallel from the same view of the data;
+* on other databases (SQLite) models are exported one after another inside
+  a single read transaction, since a snapshot cannot be shared across
+  connections there.
+
+``import_csv_file`` is the batched import path: cells are converted with each
+field's ``to_python`` in memory, foreign keys are checked against one lookup
+per related model per chunk (instead of a ``get()`` per cell), and each
+chunk is written with a single executemany INSERT and committed. After each commit the
+file's position is saved in ``CsvCheckpoints``, so an interrupted import
+resumes after the last committed chunk. Like ``bulk_create``, this path
+skips ``save()`` and signals, except when a chunk fails: its rows are then
+retried one ``save()`` at a time. What the signals maintain is redone once
+per file instead: the permission matrices and version after a Role,
+AppModel, PermissionType or RoleModelPermission import, the AuditLogRollup
+buckets after an AuditLog import.
+
+Primary keys are imported as they are, so the files of a whole app (or of
+every app) load in one pass when taken in ``dependency_order``: parents
+before the rows that point at them. A reference to a row further down the
+same file (``Role.parent``, ``User.created_by``) is set once that row is in;
+the pending references are saved with the checkpoint, and one whose target
+row was rejected stays empty.
+With ``upsert`` a row whose key already exists overwrites it (the backend's
+``ON CONFLICT ... DO UPDATE``, as ``bulk_create(update_conflicts=True)``),
+so importing the same files twice leaves one copy of each row.
+"""
+import csv
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, models, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+
+
+EXCLUDED_APPS = [
+    "auth",
+    "admin",
+    "contenttypes",
+    "sessions",
+    "Restaurant",
+    "Review"
+]
+
+
+def exportable_models(labels=None):
+    """Models of the installed apps (minus EXCLUDED_APPS), or those named ``app.Model``."""
+    if labels:
+        return [apps.get_model(label) for label in labels]
+    return [
+        model
+        for app_config in apps.get_app_configs()
+        if app_config.label not in EXCLUDED_APPS
+        for model in app_config.get_models()
+        if not model._meta.proxy
+    ]
+
+
+def csv_columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def csv_file_name(model):
+    return f"{model._meta.app_label}_{model.__name__}.csv"
+
+
+def _converters(model):
+    converters = []
+    for field in model._meta.concrete_fields:
+        if isinstance(field, models.JSONField):
+            converters.append(lambda value: "" if value is None else json.dumps(value))
+        else:
+            converters.append(None)
+    return converters
+
+
+class RowProgress:
+    """Thread-safe row counter that reports throughput every ``interval`` seconds."""
+
+    def __init__(self, report=None, interval=5.0):
+        self._report = report
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._last_report = self._started
+        self.rows = 0
+
+    def add(self, count):
+        with self._lock:
+            self.rows += count
+            now = time.perf_counter()
+            if self._report is None or now - self._last_report < self._interval:
+                return
+            self._last_report = now
+            rows, elapsed = self.rows, now - self._started
+        self._report(f"... {rows:,} rows, {rows / elapsed:,.0f} rows/s")
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+
+def export_model(model, directory, chunk_size=2000, progress=None, using=DEFAULT_DB_ALIAS):
+    """
+    Stream one model's rows into its CSV file. Returns ``(path, rows)``; a
+    model without rows leaves no file.
+    """
+    columns = csv_columns(model)
+    rows = model._base_manager.using(using).order_by("pk").values_list(*columns)
+    return _write_csv(model, directory, rows.iterator(chunk_size=chunk_size), chunk_size, progress)
+
+
+def _write_csv(model, directory, rows, chunk_size, progress):
+    path = os.path.join(directory, csv_file_name(model))
+    converters = _converters(model)
+    convert = any(converters)
+
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(csv_columns(model))
+        batch = []
+        for row in rows:
+            if convert:
+                row = [value if fn is None else fn(value) for fn, value in zip(converters, row)]
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                writer.writerows(batch)
+                count += len(batch)
+                if progress is not None:
+                    progress.add(len(batch))
+                batch = []
+        writer.writerows(batch)
+        count += len(batch)
+        if progress is not None and batch:
+            progress.add(len(batch))
+
+    if not count:
+        os.remove(path)
+        return None, 0
+    return path, count
+
+
+@contextmanager
+def read_snapshot(using=DEFAULT_DB_ALIAS):
+    """
+    A read transaction for the export. Yields the exported snapshot id on
+    PostgreSQL (for the workers to share), else None.
+    """
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        snapshot_id = None
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                cursor.execute("SELECT pg_export_snapshot()")
+                snapshot_id = cursor.fetchone()[0]
+        yield snapshot_id
+
+
+def _timed_export(model, directory, chunk_size, progress, using):
+    started = time.perf_counter()
+    path, rows = export_model(model, directory, chunk_size, progress, using)
+    return path, rows, time.perf_counter() - started
+
+
+def _export_in_snapshot(snapshot_id, model, directory, chunk_size, progress, using):
+    # Runs on a worker thread, which has its own connection
+    connection = connections[using]
+    try:
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot_id])
+            return _timed_export(model, directory, chunk_size, progress, using)
+    finally:
+        connection.close()
+
+
+def _estimated_rows(model, using):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def export_models(models_to_export, directory, workers=4, chunk_size=2000, progress=None,
+                  on_done=None, using=DEFAULT_DB_ALIAS):
+    """
+    Export every model from one consistent snapshot. ``on_done(model, path,
+    rows, seconds)`` is called as each model finishes. Returns ``{model:
+    rows}``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    results = {}
+
+    def finished(model, path, rows, seconds):
+        results[model] = rows
+        if on_done is not None:
+            on_done(model, path, rows, seconds)
+
+    with read_snapshot(using) as snapshot_id:
+        if snapshot_id is None or workers <= 1:
+            for model in models_to_export:
+                finished(model, *_timed_export(model, directory, chunk_size, progress, using))
+            return results
+
+        # Largest tables first, so the longest export does not start last
+        ordered = sorted(models_to_export, key=lambda model: _estimated_rows(model, using), reverse=True)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="csv-export") as pool:
+            futures = {
+                pool.submit(_export_in_snapshot, snapshot_id, model, directory, chunk_size, progress, using): model
+                for model in ordered
+            }
+            for future in as_completed(futures):
+                finished(futures[future], *future.result())
+    return results
+
+
+TOMBSTONE_FILE = "deleted.csv"
+TOMBSTONE_COLUMNS = ["app_label", "model", "pk", "audit_id", "timestamp"]
+
+
+def audit_changes(models_to_export, after_id=0, since=None, lag=None, using=DEFAULT_DB_ALIAS):
+    """
+    The rows of ``models_to_export`` touched by AuditLog entries newer than
+    ``after_id`` (and at or after ``since``, if given). Returns ``(last_id,
+    {model: {pk: tombstone}})``: the next watermark, and per model the keys
+    whose latest entry is a create or update (tombstone None) or a delete
+    (``(audit_id, timestamp)``).
+
+    Ids are allocated when a row is inserted but only seen once it commits,
+    so a slow transaction (or the async audit writer) can commit an id below
+    one that is already visible. The watermark therefore stops before the
+    first entry younger than ``lag`` seconds (``AUDIT_EXPORT_LAG_SECONDS``);
+    the next run reads those entries again, and anything committed behind
+    them. A row can so be exported twice, which is harmless: the delta holds
+    current rows, not events.
+    """
+    from .models import AuditLog
+
+    if lag is None:
+        lag = getattr(settings, "AUDIT_EXPORT_LAG_SECONDS", 300)
+    cutoff = timezone.now() - timedelta(seconds=lag)
+    by_name = {model.__name__: model for model in models_to_export}
+    newer = AuditLog.objects.using(using).filter(pk__gt=after_id)
+    bounds = newer.aggregate(
+        settled=models.Max("pk", filter=models.Q(timestamp__lt=cutoff)),
+        fresh=models.Min("pk", filter=models.Q(timestamp__gte=cutoff)),
+    )
+    last_id = bounds["settled"] or after_id
+    if bounds["fresh"] is not None:
+        last_id = min(last_id, bounds["fresh"] - 1)
+    entries = newer.filter(action__in=("create", "update", "delete"), model_name__in=by_name)
+    if since is not None:
+        entries = entries.filter(timestamp__gte=since)
+
+    touched = {}
+    rows = entries.order_by("pk").values_list("pk", "action", "model_name", "object_id", "timestamp")
+    for audit_id, action, model_name, object_id, timestamp in rows.iterator():
+        model = by_name[model_name]
+        try:
+            pk = model._meta.pk.to_python(object_id)
+        except ValidationError:
+            continue
+        if pk is not None:
+            touched.setdefault(model, {})[pk] = (audit_id, timestamp) if action == "delete" else None
+    return last_id, touched
+
+
+def _rows_by_pk(model, pks, seen, using):
+    # Ordered like a full export; one query per slice the backend can bind
+    if not pks:
+        return
+    queryset = model._base_manager.using(using)
+    columns = csv_columns(model)
+    pk_index = columns.index(model._meta.pk.attname)
+    step = connections[using].ops.bulk_batch_size([model._meta.pk], pks)
+    for start in range(0, len(pks), step):
+        for row in queryset.filter(pk__in=pks[start:start + step]).order_by("pk").values_list(*columns):
+            seen.add(row[pk_index])
+            yield row
+
+
+def export_delta(models_to_export, directory, after_id=0, since=None, chunk_size=2000, progress=None,
+                 on_done=None, lag=None, using=DEFAULT_DB_ALIAS):
+    """
+    Export only what changed since the ``after_id`` AuditLog watermark: the
+    current version of every created or updated row (same file layout as a
+    full export) and a tombstone in ``deleted.csv`` for every deleted one.
+    A row that was audited but is gone without a delete entry (a bulk or
+    unattended delete) gets a tombstone too.
+
+    Changes nobody audited (bulk updates, imports) are not seen. Everything
+    is read in one snapshot. Returns ``{"from_id", "to_id", "rows":
+    {model: rows}, "deleted"}``; ``to_id`` is the next watermark, kept
+    ``lag`` seconds behind the newest entries (see ``audit_changes``).
+    """
+    os.makedirs(directory, exist_ok=True)
+    results = {"from_id": after_id, "rows": {}, "deleted": 0}
+
+    with read_snapshot(using):
+        last_id, touched = audit_changes(models_to_export, after_id, since, lag, using)
+        results["to_id"] = last_id
+        tombstones = []
+        for model, keys in touched.items():
+            started = time.perf_counter()
+            changed = sorted(pk for pk, tombstone in keys.items() if tombstone is None)
+            found = set()
+            path, rows = _write_csv(
+                model, directory, _rows_by_pk(model, changed, found, using), chunk_size, progress,
+            )
+            results["rows"][model] = rows
+            if on_done is not None:
+                on_done(model, path, rows, time.perf_counter() - started)
+
+            label = (model._meta.app_label, model.__name__)
+            for pk in sorted(keys):
+                tombstone = keys[pk]
+                if tombstone is not None:
+                    tombstones.append(label + (pk,) + tombstone)
+                elif pk not in found:
+                    tombstones.append(label + (pk, "", ""))
+
+    path = os.path.join(directory, TOMBSTONE_FILE)
+    if tombstones:
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(TOMBSTONE_COLUMNS)
+            writer.writerows(tombstones)
+    elif os.path.exists(path):
+        os.remove(path)
+    results["deleted"] = len(tombstones)
+    return results
+
+
+class CsvCheckpoints:
+    """
+    Rows already imported from each CSV file, kept in a JSON file, with the
+    self-references still waiting for rows further down the file. A
+    checkpoint only applies while the CSV's size and mtime are unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, encoding="utf-8") as fh:
+                self._state = json.load(fh)
+        except FileNotFoundError:
+            self._state = {}
+
+    @staticmethod
+    def _signature(csv_path):
+        stat = os.stat(csv_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def get(self, csv_path):
+        """``(rows done, complete)`` for this file; ``(0, False)`` if it changed."""
+        entry = self._state.get(os.path.basename(csv_path))
+        if not entry or entry["signature"] != self._signature(csv_path):
+            return 0, False
+        return entry["rows"], entry["complete"]
+
+    def deferred(self, csv_path):
+        """The ``[pk, attname, value]`` strings recorded for this file; ``[]`` if it changed."""
+        entry = self._state.get(os.path.basename(csv_path))
+        if not entry or entry["signature"] != self._signature(csv_path):
+            return []
+        return entry.get("deferred", [])
+
+    def record(self, csv_path, rows, complete=False, deferred=()):
+        self._state[os.path.basename(csv_path)] = {
+            "signature": self._signature(csv_path),
+            "rows": rows,
+            "complete": complete,
+            "deferred": [[str(row_pk), attname, str(value)] for row_pk, attname, value in deferred],
+        }
+        self._save()
+
+    def clear(self, csv_path):
+        if self._state.pop(os.path.basename(csv_path), None) is not None:
+            self._save()
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self._state, fh, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def _empty_value(field):
+    if field.null:
+        return None
+    if field.primary_key and not field.has_default():
+        return None  # the database assigns it
+    if field.has_default():
+        return field.get_default()
+    return ""
+
+
+def _cell_parser(field):
+    if isinstance(field, models.JSONField):
+        return json.loads
+    if field.is_relation:
+        return field.target_field.to_python
+    return field.to_python
+
+
+class _RowReader:
+    """Converts CSV rows of one model into attname -> value dicts."""
+
+    def __init__(self, model, header):
+        self.model = model
+        self.columns = []
+        for field in model._meta.concrete_fields:
+            if field.auto_created and not field.primary_key:
+                continue
+            # Exports write foreign keys as user_id; older ones used the name
+            for name in (field.attname, field.name):
+                if name in header:
+                    self.columns.append((field, header.index(name), _cell_parser(field)))
+                    break
+        self.required = [
+            field.attname for field in model._meta.concrete_fields
+            if not field.null and not field.blank and not field.auto_created
+        ]
+        self.foreign_keys = [field for field, _, _ in self.columns if field.is_relation]
+        self.has_pk = any(field.primary_key for field, _, _ in self.columns)
+
+    def parse(self, row):
+        """The row's values, or raise ValueError / ValidationError."""
+        values = {}
+        for field, index, parse in self.columns:
+            cell = row[index] if index < len(row) else ""
+            values[field.attname] = _empty_value(field) if cell == "" else parse(cell)
+        return values
+
+
+class _ForeignKeyCache:
+    """Which related keys exist, loaded with one query per model per chunk."""
+
+    def __init__(self):
+        self._known = {}
+
+    def resolve(self, field, wanted):
+        target = field.target_field.attname
+        related = field.related_model
+        known = self._known.setdefault(related, {})
+        missing = [value for value in wanted if value not in known]
+        if missing:
+            found = set(related._base_manager.filter(**{f"{target}__in": missing}).values_list(target, flat=True))
+            known.update((value, value in found) for value in missing)
+        return known
+
+    def add(self, model, values):
+        """Record keys this import has just inserted."""
+        self._known.setdefault(model, {}).update((value, True) for value in values)
+
+
+class _RowInserter:
+    """
+    One INSERT statement run with executemany for a whole chunk. bulk_create
+    builds model instances and compiles a statement per few dozen rows,
+    which costs more than the insert itself.
+    """
+
+    def __init__(self, model, with_pk=False, upsert=False, using=DEFAULT_DB_ALIAS):
+        self.model = model
+        self.upsert = upsert
+        self.connection = connections[using]
+        # Keys the database generates (AutoField) are left to it unless the
+        # CSV carries them
+        self.fields = [
+            field for field in model._meta.concrete_fields
+            if not getattr(field, "db_returning", False) or (field.primary_key and with_pk)
+        ]
+        quote = self.connection.ops.quote_name
+        self.sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+            quote(model._meta.db_table),
+            ", ".join(quote(field.column) for field in self.fields),
+            ", ".join(["%s"] * len(self.fields)),
+        )
+        if upsert:
+            # The statement bulk_create(update_conflicts=True) would issue
+            pk = model._meta.pk
+            self.sql += " " + self.connection.ops.on_conflict_suffix_sql(
+                self.fields,
+                OnConflict.UPDATE,
+                [field.column for field in self.fields if field is not pk],
+                [pk.column],
+            )
+
+    def _fill(self, field):
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+            return timezone.now()
+        return field.get_default()
+
+    def insert(self, rows):
+        connection = self.connection
+        preps = [(field.attname, field.get_db_prep_save, field) for field in self.fields]
+        params = []
+        for values in rows:
+            row = []
+            for attname, prep, field in preps:
+                value = values[attname] if attname in values else self._fill(field)
+                row.append(None if value is None else prep(value, connection))
+            params.append(row)
+        with connection.cursor() as cursor:
+            cursor.executemany(self.sql, params)
+
+
+def import_csv_file(model, csv_path, batch_size=1000, checkpoints=None, progress=None, on_skip=None,
+                    upsert=False):
+    """
+    Import one CSV file into ``model`` in chunks of ``batch_size`` rows,
+    committing each. Primary keys are kept, so foreign keys in files
+    imported later still point at the right rows. With ``upsert`` a row
+    whose key already exists overwrites it instead of being skipped.
+
+    Returns counts ``{"imported", "skipped", "resumed_from"}`` and
+    ``"complete"``, true when a checkpoint says the file was already
+    imported (nothing is read then). ``on_skip(line, reason)`` is called for
+    every rejected row.
+    """
+    done, complete = checkpoints.get(csv_path) if checkpoints else (0, False)
+    stats = {"imported": 0, "skipped": 0, "resumed_from": done, "complete": complete}
+    if complete:
+        return stats
+
+    def skip(line, reason):
+        stats["skipped"] += 1
+        if on_skip is not None:
+            on_skip(line, reason)
+
+    foreign_keys = _ForeignKeyCache()
+    timestamps = [] if model._meta.label == "MBP.AuditLog" else None  # first and last, for the rollups
+    with open(csv_path, newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if header is None:
+            return stats
+        rows = _RowReader(model, header)
+        inserter = _RowInserter(model, with_pk=rows.has_pk, upsert=upsert)
+        self_references = [field for field in rows.foreign_keys if field.related_model is model]
+        in_file = _keys_in_file(csv_path, self_references)
+        # (pk, attname, value) set once the referenced row is in; a resumed
+        # import picks up the ones its earlier run recorded
+        deferred = _load_deferred(model, self_references, checkpoints.deferred(csv_path)) if done else []
+        position = done
+        numbered = enumerate(itertools.islice(reader, done, None), start=done + 2)  # line 1 is the header
+
+        while True:
+            chunk = list(itertools.islice(numbered, batch_size))
+            if not chunk:
+                break
+            position += len(chunk)
+
+            parsed = []
+            for line, row in chunk:
+                try:
+                    parsed.append((line, rows.parse(row)))
+                except (ValueError, ValidationError) as exc:
+                    skip(line, f"invalid value: {exc}")
+
+            # A dangling foreign key becomes NULL, as in the row-by-row
+            # import. A reference to a row further down the same file is
+            # filled in after that row is written.
+            for field in rows.foreign_keys:
+                wanted = {values[field.attname] for _, values in parsed} - {None}
+                if not wanted:
+                    continue
+                exists = foreign_keys.resolve(field, wanted)
+                for _, values in parsed:
+                    value = values[field.attname]
+                    if value is None or exists[value]:
+                        continue
+                    values[field.attname] = None
+                    if field in self_references and value in in_file[field] \
+                            and values.get(model._meta.pk.attname) is not None:
+                        deferred.append((values.get(model._meta.pk.attname), field.attname, value))
+
+            valid = []
+            for line, values in parsed:
+                if any(values.get(name) in (None, "") for name in rows.required):
+                    skip(line, "missing required field")
+                else:
+                    valid.append((line, values))
+
+            written = _write_chunk(inserter, valid, skip)
+            stats["imported"] += len(written)
+            if timestamps is not None:
+                chunk_times = [values["timestamp"] for values in written if values.get("timestamp")]
+                if chunk_times:
+                    timestamps[:] = [min(timestamps + chunk_times), max(timestamps + chunk_times)]
+            for field in self_references:
+                target = field.target_field.attname
+                foreign_keys.add(model, [values[target] for values in written if target in values])
+            if checkpoints:
+                checkpoints.record(csv_path, position, deferred=deferred)
+            if progress is not None:
+                progress.add(len(chunk))
+
+    _apply_deferred(model, self_references, deferred, foreign_keys, batch_size)
+    if rows.has_pk:
+        _reset_sequences(model)
+    if stats["imported"]:
+        _refresh_derived(model, timestamps)
+    if checkpoints:
+        checkpoints.record(csv_path, position, complete=True)
+    return stats
+
+
+def _refresh_derived(model, timestamps):
+    # What the skipped save() signals would have done
+    from .audit_utils import rebuild_rollups
+    from .models import AppModel, PermissionType, Role, RoleModelPermission
+    from .permission_utils import bump_permission_version, rebuild_permission_matrices
+
+    if model in (Role, AppModel, PermissionType, RoleModelPermission):
+        rebuild_permission_matrices()
+        bump_permission_version()
+    elif timestamps:
+        rebuild_rollups(*timestamps)
+
+
+def _keys_in_file(csv_path, fields):
+    """``{field: values of its target column in the file}`` for self-references."""
+    if not fields:
+        return {}
+    with open(csv_path, newline="", encoding="utf-8") as fh:
+        reader = csv.DictReader(fh)
+        keys = {field: set() for field in fields}
+        for row in reader:
+            for field, found in keys.items():
+                target = field.target_field
+                cell = row.get(target.attname, "")
+                if cell:
+                    try:
+                        found.add(target.to_python(cell))
+                    except ValidationError:
+                        pass
+    return keys
+
+
+def _load_deferred(model, fields, recorded):
+    """Parse the deferred self-references a checkpoint recorded as strings."""
+    pk = model._meta.pk
+    targets = {field.attname: field.target_field for field in fields}
+    return [
+        (pk.to_python(row_pk), attname, targets[attname].to_python(value))
+        for row_pk, attname, value in recorded
+        if attname in targets
+    ]
+
+
+def _apply_deferred(model, fields, deferred, foreign_keys, batch_size):
+    """Fill in the deferred references whose target row was actually written."""
+    pk = model._meta.pk.attname
+    by_field = {}
+    for field in fields:
+        pending = [(row_pk, value) for row_pk, attname, value in deferred if attname == field.attname]
+        if not pending:
+            continue
+        exists = foreign_keys.resolve(field, {value for _, value in pending})
+        objects = [model(**{pk: row_pk, field.attname: value}) for row_pk, value in pending if exists[value]]
+        if objects:
+            by_field[field.attname] = objects
+    if not by_field:
+        return
+    with transaction.atomic():
+        for attname, objects in by_field.items():
+            model._base_manager.bulk_update(objects, [attname], batch_size=batch_size)
+
+
+def _reset_sequences(model):
+    # Explicit keys do not advance a PostgreSQL sequence (SQLite's
+    # AUTOINCREMENT does); the next create() must not reuse an imported key
+    connection = connections[DEFAULT_DB_ALIAS]
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def dependency_order(models_to_import):
+    """
+    The models ordered so that every model comes after the models its
+    foreign keys point at (among those given). Self-references are resolved
+    within the file; a cycle between models is broken in the given order.
+    """
+    pending = list(models_to_import)
+    included = set(pending)
+    depends = {
+        model: {
+            field.related_model for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model in included and field.related_model is not model
+        }
+        for model in pending
+    }
+    ordered, placed = [], set()
+    while pending:
+        ready = [model for model in pending if depends[model] <= placed] or pending[:1]
+        for model in ready:
+            ordered.append(model)
+            placed.add(model)
+            pending.remove(model)
+    return ordered
+
+
+def _write_chunk(inserter, rows, skip):
+    """Insert the chunk; returns the values of the rows that were written."""
+    if not rows:
+        return []
+    try:
+        with transaction.atomic():
+            inserter.insert([values for _, values in rows])
+        return [values for _, values in rows]
+    except IntegrityError:
+        pass
+
+    # Find the offending rows; the rest of the chunk still goes in. save()
+    # also fills what the CSV left out, such as a missing slug or uid.
+    written = []
+    for line, values in rows:
+        try:
+            with transaction.atomic():
+                obj = inserter.model(**values)
+                if inserter.upsert:
+                    obj.save()
+                else:
+                    obj.save(force_insert=True)
+            written.append(values)
+        except IntegrityError as exc:
+            skip(line, str(exc))
+    return written
@@ -0,0 +1,126 @@
+"""
+Background system-health sampler.
+
+A daemon thread records CPU, memory, disk, a database round-trip probe and
+this process's own stats every ``HEALTH_SAMPLE_INTERVAL`` seconds into a ring
+of the last ``HEALTH_HISTORY_SIZE`` snapshots. The health endpoint answers
+from the latest snapshot instead of sampling (``psutil.cpu_percent(interval=1)``
+blocked a worker for a second per call). CPU figures are measured over the
+time since the previous sample, so no request ever sleeps; the thread primes
+the counters and waits up to a second before its first sample, and until
+that sample exists the endpoint has nothing to report.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+
+import psutil
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+class HealthSampler:
+    def __init__(self, interval=None, size=None):
+        self._interval = interval
+        self._size = size
+        self._history = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._process = None
+
+    @property
+    def interval(self):
+        return self._interval or getattr(settings, "HEALTH_SAMPLE_INTERVAL", 5.0)
+
+    def _ring(self):
+        if self._history is None:
+            self._history = deque(maxlen=self._size or getattr(settings, "HEALTH_HISTORY_SIZE", 120))
+        return self._history
+
+    def _probe_database(self):
+        start = time.perf_counter()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+        except Exception:
+            return None
+        return (time.perf_counter() - start) * 1000
+
+    def _prime(self):
+        # cpu_percent(None) reports the usage since the previous call; the
+        # first call only starts the clock and returns 0.0
+        self._process = psutil.Process()
+        self._process.cpu_percent(None)
+        psutil.cpu_percent(None)
+
+    def sample(self):
+        """Take one snapshot and add it to the history."""
+        if self._process is None or self._process.pid != os.getpid():
+            self._prime()
+
+        memory = psutil.virtual_memory()
+        with self._process.oneshot():
+            process = {
+                "pid": self._process.pid,
+                "cpu_percent": self._process.cpu_percent(None),
+                "rss_mb": round(self._process.memory_info().rss / 2**20, 1),
+                "threads": self._process.num_threads(),
+            }
+        db_latency = self._probe_database()
+        snapshot = {
+            "sampled_at": timezone.now(),
+            "cpu_percent": psutil.cpu_percent(None),
+            "memory_percent": memory.percent,
+            "disk_percent": psutil.disk_usage("/").percent,
+            "db_ok": db_latency is not None,
+            "db_latency_ms": round(db_latency, 2) if db_latency is not None else None,
+            "boot_time": datetime.fromtimestamp(psutil.boot_time(), tz=dt_timezone.utc),
+            "process": process,
+        }
+        with self._lock:
+            self._ring().append(snapshot)
+        return snapshot
+
+    def _run(self):
+        self._prime()
+        # Give the first sample a window to measure CPU over
+        time.sleep(min(1.0, self.interval))
+        while True:
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("Health sample failed")
+            finally:
+                close_old_connections()
+            time.sleep(self.interval)
+
+    def ensure_started(self):
+        # A forked worker inherits the history but not the thread
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="health-sampler", daemon=True)
+            self._thread.start()
+
+    def latest(self):
+        with self._lock:
+            history = self._ring()
+            return history[-1] if history else None
+
+    def history(self):
+        with self._lock:
+            return list(self._ring())
+
+
+health_sampler = HealthSampler()
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from MBP.archive_utils import archive_audit_logs, archive_dir
+
+class Command(BaseCommand):
+    help = 'Move old AuditLog rows into monthly gzip JSONL archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=settings.AUDIT_LOG_RETENTION_DAYS,
+            help='Archive rows older than this many days (default: AUDIT_LOG_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        archived = archive_audit_logs(older_than_days=options['older_than_days'])
+
+        for month, count in sorted(archived.items()):
+            self.stdout.write(f"{month}: {count} rows")
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {sum(archived.values())} AuditLogs into {archive_dir()}."
+        ))
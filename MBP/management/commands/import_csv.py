@@ -5,7 +5,10 @@ from django.apps import apps
 from django.conf import settings
 from django.db import IntegrityError, transaction
 
+from MBP.csv_utils import CsvCheckpoints, RowProgress, dependency_order, import_csv_file
+
 CSV_DIR = os.path.join(settings.BASE_DIR, "csv_exports")
+CHECKPOINT_FILE = os.path.join(CSV_DIR, ".import_checkpoints.json")
 
 class Command(BaseCommand):
     help = "Import CSV data (supports app / model / file level import)"
@@ -14,12 +17,38 @@ class Command(BaseCommand):
         parser.add_argument("--app", type=str, help="Import all models of an app")
         parser.add_argument("--model", type=str, help="Import a single model: app.Model")
         parser.add_argument("--file", type=str, help="Import a specific CSV file")
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Import every CSV in the directory, parents before children",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Rows per bulk insert and commit (default: 1000)",
+        )
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Ignore checkpoints and import the files from the first row",
+        )
+        parser.add_argument(
+            "--upsert", action="store_true",
+            help="Overwrite rows whose primary key already exists instead of skipping them",
+        )
+        parser.add_argument(
+            "--row-by-row", action="store_true",
+            help="Old path: one create() per row in a single transaction (runs save() and signals)",
+        )
 
     def handle(self, *args, **options):
         if not os.path.exists(CSV_DIR):
             self.stdout.write(self.style.ERROR("CSV directory not found"))
             return
 
+        self.batch_size = options["batch_size"]
+        self.restart = options["restart"]
+        self.row_by_row = options["row_by_row"]
+        self.upsert = options["upsert"]
+        self.checkpoints = CsvCheckpoints(CHECKPOINT_FILE)
+
         if options["file"]:
             self.import_by_file(options["file"])
             return
@@ -32,9 +61,13 @@ class Command(BaseCommand):
             self.import_by_app(options["app"])
             return
 
+        if options["all"]:
+            self.import_files(os.listdir(CSV_DIR))
+            return
+
         self.stdout.write(
             self.style.ERROR(
-                "Please specify --app OR --model OR --file"
+                "Please specify --app OR --model OR --file OR --all"
             )
         )
 
@@ -68,16 +101,29 @@ class Command(BaseCommand):
         self.import_model_csv(app_label, model_name, file_name)
 
     def import_by_app(self, app_label):
-        for file_name in os.listdir(CSV_DIR):
-            if file_name.startswith(f"{app_label}_") and file_name.endswith(".csv"):
-                _, model_name = file_name.replace(".csv", "").split("_", 1)
-                self.import_model_csv(app_label, model_name, file_name)
+        self.import_files(
+            file_name for file_name in os.listdir(CSV_DIR) if file_name.startswith(f"{app_label}_")
+        )
+
+    def import_files(self, file_names):
+        # Parents first, so foreign keys find the rows they point at
+        found = {}
+        for file_name in sorted(file_names):
+            if not file_name.endswith(".csv"):
+                continue
+            try:
+                app_label, model_name = file_name[:-len(".csv")].split("_", 1)
+                found[apps.get_model(app_label, model_name)] = file_name
+            except (ValueError, LookupError):
+                self.stdout.write(self.style.WARNING(f"No model for {file_name}"))
+
+        for model in dependency_order(found):
+            self.import_model_csv(model._meta.app_label, model.__name__, found[model])
 
     # -------------------------------
     # CORE IMPORT LOGIC (SAFE)
     # -------------------------------
 
-    @transaction.atomic
     def import_model_csv(self, app_label, model_name, file_name):
         try:
             model = apps.get_model(app_label, model_name)
@@ -95,6 +141,47 @@ class Command(BaseCommand):
             ))
             return
 
+        if self.row_by_row:
+            self.import_rows_one_by_one(model, file_path)
+            return
+        self.import_rows_batched(model, file_path)
+
+    # -------------------------------
+    # BATCHED IMPORT (DEFAULT)
+    # -------------------------------
+
+    def import_rows_batched(self, model, file_path):
+        label = f"{model._meta.app_label}.{model.__name__}"
+        if self.restart:
+            self.checkpoints.clear(file_path)
+
+        def skipped(line, reason):
+            self.stdout.write(self.style.WARNING(f"Skipped line {line} in {model.__name__} ({reason})"))
+
+        progress = RowProgress(report=self.stdout.write)
+        stats = import_csv_file(
+            model, file_path, batch_size=self.batch_size,
+            checkpoints=self.checkpoints, progress=progress, on_skip=skipped, upsert=self.upsert,
+        )
+        if stats["complete"]:
+            self.stdout.write(f"Already imported: {label} (use --restart to import it again)")
+            return
+        if stats["resumed_from"]:
+            self.stdout.write(f"Resumed {label} after row {stats['resumed_from']}")
+
+        rate = progress.rows / max(progress.elapsed, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported: {label} ({stats['imported']:,} rows, {stats['skipped']:,} skipped, {rate:,.0f} rows/s)"
+        ))
+
+    # -------------------------------
+    # ROW-BY-ROW IMPORT (--row-by-row)
+    # -------------------------------
+
+    @transaction.atomic
+    def import_rows_one_by_one(self, model, file_path):
+        app_label, model_name = model._meta.app_label, model.__name__
+
         required_fields = [
             field.name
             for field in model._meta.fields
@@ -1,28 +1,24 @@
 from django.core.management.base import BaseCommand
-from django.apps import apps
-from django.utils.text import slugify
-from MBP.models import AppModel
+from MBP.app_model_utils import sync_app_models
 
 class Command(BaseCommand):
-    help = 'Populate all models into AppModel table'
+    help = 'Sync the AppModel table with the installed models'
 
-    def handle(self, *args, **kwargs):
-        count = 0
-        for model in apps.get_models():
-            model_name = model.__name__
-            app_label = model._meta.app_label
-            verbose_name = model._meta.verbose_name.title()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Delete AppModels whose model no longer exists (this also deletes their role grants)',
+        )
 
-            slug = slugify(f"{app_label}-{model_name}")
+    def handle(self, *args, **options):
+        result = sync_app_models(prune=options['prune'])
 
-            if not AppModel.objects.filter(name=model_name, app_label=app_label).exists():
-                AppModel.objects.create(
-                    name=model_name,
-                    slug=slug,
-                    verbose_name=verbose_name,
-                    app_label=app_label,
-                    description=f"Auto-added model: {verbose_name}"
-                )
-                count += 1
-
-        self.stdout.write(self.style.SUCCESS(f"Added {count} new AppModels."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {len(result['added'])} new AppModels, updated {len(result['updated'])}, "
+            f"removed {len(result['removed'])}."
+        ))
+        if result['stale'] and not options['prune']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(result['stale'])} AppModels have no installed model; rerun with --prune to remove them."
+            ))
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from MBP.seed_utils import BENCH_EMAIL_DOMAIN, BENCH_PASSWORD, clear_seeded, seed, seeded_users
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with deterministic synthetic data for load and scale testing: users with roles '
+        'and profiles, attendance, work log and leave history, tasks, role permissions and audit logs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create (default: 1000)')
+        parser.add_argument('--days', type=int, default=90, help='Days of history per user (default: 90)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same rows')
+        parser.add_argument('--tasks-per-user', type=int, default=2)
+        parser.add_argument('--audit-per-user', type=int, default=20, help='AuditLog rows per user')
+        parser.add_argument('--block', type=int, default=1000, help='Users written and committed per block')
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help=f'Delete the users of an earlier run (emails at {BENCH_EMAIL_DOMAIN}) and their data first',
+        )
+
+    def handle(self, *args, **options):
+        if seeded_users().exists():
+            if not options['reset']:
+                raise CommandError('Synthetic users already exist; rerun with --reset to replace them.')
+            deleted = clear_seeded()
+            self.stdout.write(f'Deleted {deleted:,} rows of the previous dataset.')
+
+        started = time.perf_counter()
+        total = options['users']
+
+        def report(done):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'... {done:,}/{total:,} users ({done / max(elapsed, 1e-9):,.0f} users/s)')
+
+        seed(
+            users=total,
+            days=options['days'],
+            seed=options['seed'],
+            tasks_per_user=options['tasks_per_user'],
+            audit_per_user=options['audit_per_user'],
+            block=options['block'],
+            progress=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {total:,} users x {options["days"]} days in {time.perf_counter() - started:.1f}s '
+            f'(password: {BENCH_PASSWORD}).'
+        ))
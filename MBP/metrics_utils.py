@@ -0,0 +1,120 @@
+"""
+In-process request metrics in the Prometheus text exposition format.
+
+``RequestMetricsMiddleware`` (MBP.middleware) records, per resolved view and
+method: a latency histogram, a response-size histogram, a histogram of
+queries per request and the total time spent in the database. Everything
+lives in plain dictionaries behind one lock, so recording a request costs a
+few dictionary updates. Values are per process; Prometheus sums the workers
+when it scrapes each of them.
+"""
+import threading
+from bisect import bisect_left
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    LABELS = ("view", "method")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}  # (view, method, status) -> count
+        self._latency = {}  # (view, method) -> Histogram
+        self._size = {}
+        self._queries = {}
+        self._db_seconds = {}  # (view, method) -> float
+
+    def record(self, view, method, status, seconds, size, queries, db_seconds):
+        key = (view, method)
+        with self._lock:
+            self._requests[key + (str(status),)] = self._requests.get(key + (str(status),), 0) + 1
+            self._histogram(self._latency, key, LATENCY_BUCKETS).observe(seconds)
+            if size is not None:
+                self._histogram(self._size, key, SIZE_BUCKETS).observe(size)
+            self._histogram(self._queries, key, QUERY_BUCKETS).observe(queries)
+            self._db_seconds[key] = self._db_seconds.get(key, 0.0) + db_seconds
+
+    @staticmethod
+    def _histogram(store, key, buckets):
+        histogram = store.get(key)
+        if histogram is None:
+            histogram = store[key] = Histogram(buckets)
+        return histogram
+
+    def reset(self):
+        with self._lock:
+            for store in (self._requests, self._latency, self._size, self._queries, self._db_seconds):
+                store.clear()
+
+    def _render_histogram(self, lines, name, help_text, store):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in sorted(store.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = _labels(self.LABELS, key, 'le="%s"' % le)
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_labels(self.LABELS, key)} {_number(histogram.sum)}")
+            lines.append(f"{name}_count{_labels(self.LABELS, key)} {histogram.count}")
+
+    def render(self):
+        """The current values in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            lines = [
+                "# HELP http_requests_total Requests handled, by view, method and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for key, count in sorted(self._requests.items()):
+                lines.append(f"http_requests_total{_labels(self.LABELS + ('status',), key)} {count}")
+
+            self._render_histogram(
+                lines, "http_request_duration_seconds", "Time to produce the response.", self._latency)
+            self._render_histogram(
+                lines, "http_response_size_bytes", "Response body size (streaming responses excluded).", self._size)
+            self._render_histogram(
+                lines, "http_request_db_queries", "Database queries run per request.", self._queries)
+
+            lines.append("# HELP http_request_db_seconds_total Time spent in database queries.")
+            lines.append("# TYPE http_request_db_seconds_total counter")
+            for key, seconds in sorted(self._db_seconds.items()):
+                lines.append(f"http_request_db_seconds_total{_labels(self.LABELS, key)} {_number(seconds)}")
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,65 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics_utils import request_metrics
+
+
+class _QueryTimer:
+    """execute_wrapper that counts queries and adds up their time."""
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, response size, query count and DB time per resolved
+    view (URL name, else the view's dotted path) into
+    MBP.metrics_utils.request_metrics, served at /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, "METRICS_ENABLED", True):
+            return self.get_response(request)
+
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        request_metrics.record(
+            view=self._view_label(request),
+            method=request.method,
+            status=response.status_code,
+            seconds=elapsed,
+            size=None if response.streaming else len(response.content),
+            queries=timer.queries,
+            db_seconds=timer.seconds,
+        )
+        return response
+
+    @staticmethod
+    def _view_label(request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return "<unresolved>"
+        return match.view_name or match._func_path
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.10 on 2026-10-17 21:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+PERMISSION_BITS = {'c': 1, 'r': 2, 'u': 4, 'd': 8}
+
+
+def populate_matrix(apps, schema_editor):
+    RoleModelPermission = apps.get_model('MBP', 'RoleModelPermission')
+    RolePermissionMatrix = apps.get_model('MBP', 'RolePermissionMatrix')
+
+    masks = {}
+    grants = RoleModelPermission.objects.values_list('role_id', 'model_id', 'permission_type__code')
+    for role_id, model_id, code in grants.iterator():
+        key = (role_id, model_id)
+        masks[key] = masks.get(key, 0) | PERMISSION_BITS.get(code.lower(), 0)
+
+    RolePermissionMatrix.objects.bulk_create(
+        [
+            RolePermissionMatrix(role_id=role_id, model_id=model_id, mask=mask)
+            for (role_id, model_id), mask in masks.items()
+            if mask
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MBP', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RolePermissionMatrix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mask', models.PositiveSmallIntegerField(default=0)),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='role_matrix', to='MBP.appmodel')),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='permission_matrix', to='MBP.role')),
+            ],
+            options={
+                'unique_together': {('role', 'model')},
+            },
+        ),
+        migrations.RunPython(populate_matrix, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.10 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MBP', '0003_role_permission_matrix'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=100)),
+                ('base', models.CharField(max_length=255)),
+                ('next_value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('scope', 'base')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-17 21:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_direct_masks(apps, schema_editor):
+    # No role has a parent yet, so the closure is the direct grant
+    RolePermissionMatrix = apps.get_model('MBP', 'RolePermissionMatrix')
+    RolePermissionMatrix.objects.update(effective_mask=models.F('mask'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MBP', '0004_slug_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='role',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Role whose permissions this role inherits.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='MBP.role'),
+        ),
+        migrations.AddField(
+            model_name='rolepermissionmatrix',
+            name='effective_mask',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(copy_direct_masks, migrations.RunPython.noop),
+    ]
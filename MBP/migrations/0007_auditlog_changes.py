@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-17 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MBP', '0006_auditlog_event_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='changes',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-17 21:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MBP', '0007_auditlog_changes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['timestamp', 'id'], name='auditlog_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='auditlog_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['action', 'timestamp', 'id'], name='auditlog_action_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_name', 'object_id'], name='auditlog_object_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.10 on 2026-10-17 21:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+
+
+def backfill_rollups(apps, schema_editor):
+    AuditLog = apps.get_model('MBP', 'AuditLog')
+    AuditLogRollup = apps.get_model('MBP', 'AuditLogRollup')
+
+    for granularity, trunc in [('hour', TruncHour), ('day', TruncDay)]:
+        rows = (
+            AuditLog.objects
+            .annotate(bucket=trunc('timestamp'), model=Coalesce('model_name', models.Value('')))
+            .values('bucket', 'action', 'model', 'user_id')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        AuditLogRollup.objects.bulk_create(
+            (
+                AuditLogRollup(
+                    granularity=granularity,
+                    bucket=row['bucket'],
+                    action=row['action'],
+                    model_name=row['model'],
+                    user_id=row['user_id'],
+                    count=row['total'],
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MBP', '0008_auditlog_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour/day (UTC)')),
+                ('action', models.CharField(max_length=50)),
+                ('model_name', models.CharField(blank=True, default='', max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'granularity', 'bucket'], name='auditrollup_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket', 'action', 'model_name', 'user'), name='auditrollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
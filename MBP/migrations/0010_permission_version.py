@@ -0,0 +1,20 @@
+# Generated by Django 5.2.10 on 2026-10-17 22:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MBP', '0009_auditlog_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PermissionVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField()),
+            ],
+        ),
+    ]
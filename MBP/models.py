@@ -1,17 +1,45 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.text import slugify
+from django.utils import timezone
 import uuid
 from django.conf import settings
 
+
+def _allocate_slug(model, base):
+    # Imported lazily: slug_utils depends on SlugCounter defined below
+    from .slug_utils import allocate_slug
+    return allocate_slug(model, base)
+
+
 class Role(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(unique=True, blank=True)
     description = models.TextField(blank=True)
+    parent = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='children',
+        help_text="Role whose permissions this role inherits."
+    )
+
+    def clean(self):
+        super().clean()
+        if self.parent_id is None:
+            return
+        # Imported lazily: permission_utils depends on the models below.
+        # _lineage stops at a role it has seen, so an existing loop ends too
+        from .permission_utils import _lineage
+        parents = dict(Role.objects.exclude(pk=self.pk).values_list('id', 'parent_id'))
+        if self.pk in _lineage(self.parent_id, parents):
+            raise ValidationError({'parent': "A role cannot inherit from itself or its descendants."})
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = _allocate_slug(Role, slugify(self.name))
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -28,7 +56,7 @@ class AppModel(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = _allocate_slug(AppModel, slugify(self.name))
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -45,7 +73,7 @@ class PermissionType(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = _allocate_slug(PermissionType, slugify(self.name))
         super().save(*args, **kwargs)
 
 class RoleModelPermission(models.Model):
@@ -64,17 +92,60 @@ class RoleModelPermission(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             base = f"{self.role.name}-{self.model.name}-{self.permission_type.slug}"
-            base_slug = slugify(base)
-            unique_slug = base_slug
-            counter = 1
+            self.slug = _allocate_slug(RoleModelPermission, slugify(base))
 
-            while RoleModelPermission.objects.filter(slug=unique_slug).exclude(pk=self.pk).exists():
-                unique_slug = f"{base_slug}-{counter}"
-                counter += 1
+        super().save(*args, **kwargs)
 
-            self.slug = unique_slug
 
-        super().save(*args, **kwargs)
+class PermissionVersion(models.Model):
+    """
+    Single-row stamp that MBP.permission_utils compares compiled permission
+    matrices against. It lives in the database, not a per-process cache, so
+    every worker sees a grant change as soon as it commits.
+    """
+    value = models.BigIntegerField()
+
+    def __str__(self):
+        return str(self.value)
+
+
+class SlugCounter(models.Model):
+    """
+    Next free numeric suffix for a base slug within one model, so
+    MBP.slug_utils can hand out unique slugs without probing the table.
+    """
+    scope = models.CharField(max_length=100)  # model label, e.g. "MBP.Role"
+    base = models.CharField(max_length=255)
+    next_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('scope', 'base')
+
+    def __str__(self):
+        return f"{self.scope}: {self.base} → {self.next_value}"
+
+
+# Bit assigned to each CRUD permission code in RolePermissionMatrix.mask
+PERMISSION_BITS = {'c': 1, 'r': 2, 'u': 4, 'd': 8}
+
+
+class RolePermissionMatrix(models.Model):
+    """
+    Compact view of RoleModelPermission: one row per (role, model) with the
+    granted CRUD codes packed into a 4-bit mask. ``effective_mask`` is the
+    materialized closure over the role's parents, i.e. what the role may do.
+    Kept in sync by MBP.signals.
+    """
+    role = models.ForeignKey(Role, on_delete=models.CASCADE, related_name="permission_matrix")
+    model = models.ForeignKey(AppModel, on_delete=models.CASCADE, related_name="role_matrix")
+    mask = models.PositiveSmallIntegerField(default=0)
+    effective_mask = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('role', 'model')
+
+    def __str__(self):
+        return f"{self.role.name} — {self.model.name} [{self.effective_mask:04b}]"
 
 
 class AuditLog(models.Model):
@@ -101,9 +172,62 @@ class AuditLog(models.Model):
     details = models.TextField(blank=True, null=True)
     old_data = models.JSONField(null=True, blank=True)
     new_data = models.JSONField(null=True, blank=True)
+    # Update audits in "diff" mode store only {field: [old, new]} here and
+    # leave old_data/new_data empty (see MBP.audit_utils.audit_states)
+    changes = models.JSONField(null=True, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when the buffered writer inserts it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Newest-first listings, whole table or per user / per action
+            models.Index(fields=['timestamp', 'id'], name='auditlog_ts_idx'),
+            models.Index(fields=['user', 'timestamp', 'id'], name='auditlog_user_ts_idx'),
+            models.Index(fields=['action', 'timestamp', 'id'], name='auditlog_action_ts_idx'),
+            # One object's history (see audit_utils.audit_states)
+            models.Index(fields=['model_name', 'object_id'], name='auditlog_object_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.timestamp.strftime('%Y-%m-%d %H:%M:%S')} | {self.user} | {self.action} | {self.model_name} ({self.object_id})"
\ No newline at end of file
+        return f"{self.timestamp.strftime('%Y-%m-%d %H:%M:%S')} | {self.user} | {self.action} | {self.model_name} ({self.object_id})"
+
+
+class AuditLogRollup(models.Model):
+    """
+    AuditLog counts per (bucket, action, model, user), kept up to date by the
+    audit writer so activity charts read buckets instead of scanning logs.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the hour/day (UTC)")
+    action = models.CharField(max_length=50)
+    model_name = models.CharField(max_length=100, blank=True, default='')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="audit_rollups"
+    )
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULL users compare distinct, so rows of deleted users never clash
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'action', 'model_name', 'user'],
+                name='auditrollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'granularity', 'bucket'], name='auditrollup_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} | {self.action} | {self.model_name} | {self.count}"
+
@@ -0,0 +1,112 @@
+"""
+Keyset (seek) pagination for append-mostly tables such as AuditLog.
+
+Pages are ordered by ``(timestamp, id)`` descending, and the cursor carries
+the last row's pair, so fetching any page is an index range scan that costs
+the same on page 1 and page 10,000 -- unlike offset pagination, whose cost
+grows with the offset. The cursor is opaque to clients: follow ``next``.
+
+A view may define ``get_cold_rows(position, limit)`` returning rows stored
+outside the queryset, already filtered and newest first; they are merged in
+when the queryset cannot fill a page.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    ordering_field = 'timestamp'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        queryset = queryset.order_by(f'-{self.ordering_field}', '-pk')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{self.ordering_field}__lt': value})
+                | Q(**{self.ordering_field: value, 'pk__lt': pk})
+            )
+
+        limit = self.page_size_value + 1
+        rows = list(queryset[:limit])
+
+        # Rows moved out of the table (e.g. archived audit logs) are merged in
+        # only once the table itself runs short.
+        get_cold_rows = getattr(view, 'get_cold_rows', None)
+        if len(rows) < limit and get_cold_rows is not None:
+            seen = {row.pk for row in rows}
+            cold = [row for row in get_cold_rows(position, limit) if row.pk not in seen]
+            rows = sorted(
+                rows + cold,
+                key=lambda row: (getattr(row, self.ordering_field), row.pk),
+                reverse=True,
+            )[:limit]
+        self.has_next = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            value, pk = parse_datetime(value), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def encode_cursor(self, row):
+        position = [getattr(row, self.ordering_field).isoformat(), row.pk]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
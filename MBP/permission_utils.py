@@ -0,0 +1,333 @@
+"""
+Compiled, versioned permission matrices for HasModelPermission.
+
+Each role's effective grants (its own plus those inherited from parent roles)
+are loaded once per process from RolePermissionMatrix into a dictionary of
+``{model_name_lower: mask}``, where the mask packs the CRUD codes using
+``PERMISSION_BITS``. A single version stamp is bumped by signals whenever
+roles, models, permission types or grants change; a matrix compiled under an
+older stamp is simply recompiled on next use.
+
+The stamp must be shared by every worker process, or a revoked grant keeps
+authorizing in the workers that did not handle the change. Its source of
+truth is the database (MBP.PermissionVersion, one row), not the Django
+cache, which is a per-process LocMemCache unless CACHES says otherwise. The
+bump is written in the same transaction as the grant change, so no worker
+sees the new stamp before the new grants.
+
+Each process keeps the stamp it last read for ``PERMISSION_VERSION_TTL``
+seconds, so in the steady state a permission check runs no query at all: a
+dictionary lookup in the matrix, or in the token's claims when
+``PERMISSION_CLAIMS_IN_TOKEN`` is on. The price is that a change made by
+another worker is seen up to that many seconds late; the worker that made
+it drops its copy at once, and again when the transaction commits.
+"""
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import PERMISSION_BITS, PermissionVersion, Role, RoleModelPermission, RolePermissionMatrix
+
+
+PERMISSION_VERSION_ID = 1
+
+# Access-token claims used when settings.PERMISSION_CLAIMS_IN_TOKEN is on
+ROLE_CLAIM = "rid"
+PERMISSIONS_CLAIM = "perms"
+PERMISSION_VERSION_CLAIM = "pv"
+
+_lock = threading.Lock()
+_role_matrices = {}  # role_id -> (version, {model_name_lower: mask})
+_role_manifests = {}  # role_id -> (version, etag, permission list)
+_version = (None, 0.0)  # (stamp, time.monotonic() when it was read)
+_deferred = threading.local()
+
+
+def mask_from_codes(codes):
+    mask = 0
+    for code in codes:
+        mask |= PERMISSION_BITS.get(code.lower(), 0)
+    return mask
+
+
+def codes_from_mask(mask):
+    return [code for code, bit in PERMISSION_BITS.items() if mask & bit]
+
+
+def read_permission_version():
+    """The stamp as stored in the database, bypassing the per-process copy."""
+    version = PermissionVersion.objects.filter(pk=PERMISSION_VERSION_ID).values_list("value", flat=True).first()
+    if version is None:
+        version = PermissionVersion.objects.get_or_create(
+            pk=PERMISSION_VERSION_ID, defaults={"value": time.time_ns()}
+        )[0].value
+    return version
+
+
+def get_permission_version():
+    """The stamp, read from the database at most once per ``PERMISSION_VERSION_TTL`` seconds."""
+    global _version
+    version, read_at = _version
+    now = time.monotonic()
+    if version is not None and now - read_at < getattr(settings, "PERMISSION_VERSION_TTL", 2.0):
+        return version
+    version = read_permission_version()
+    _version = (version, now)
+    return version
+
+
+def forget_permission_version():
+    global _version
+    _version = (None, 0.0)
+
+
+def bump_permission_version():
+    # Never below the clock: a stamp restored by a rollback or a database
+    # restore must not match matrices compiled after it.
+    updated = PermissionVersion.objects.filter(pk=PERMISSION_VERSION_ID).update(
+        value=Greatest(F("value") + 1, time.time_ns())
+    )
+    if not updated:
+        PermissionVersion.objects.get_or_create(pk=PERMISSION_VERSION_ID, defaults={"value": time.time_ns()})
+    # This thread sees its own change at once; other threads of the process
+    # may have re-read the old stamp before the commit, so forget it again then
+    forget_permission_version()
+    transaction.on_commit(forget_permission_version)
+
+
+def compile_role_matrix(role_id):
+    matrix = {}
+    rows = RolePermissionMatrix.objects.filter(role_id=role_id).values_list("model__name", "effective_mask")
+    for model_name, mask in rows:
+        key = model_name.lower()
+        matrix[key] = matrix.get(key, 0) | mask
+    return matrix
+
+
+def get_role_matrix(role_id, version=None):
+    if version is None:
+        version = get_permission_version()
+    cached = _role_matrices.get(role_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    matrix = compile_role_matrix(role_id)
+    with _lock:
+        _role_matrices[role_id] = (version, matrix)
+    return matrix
+
+
+def role_has_permission(role_id, model_name, permission_code, version=None):
+    bit = PERMISSION_BITS.get(permission_code.lower(), 0)
+    return bool(get_role_matrix(role_id, version).get(model_name.lower(), 0) & bit)
+
+
+def role_permission_list(role_id):
+    """
+    The ``[{"model_name", "permission"}, ...]`` payload returned at login,
+    built from the role's RolePermissionMatrix rows, inherited grants included.
+    """
+    rows = RolePermissionMatrix.objects.filter(role_id=role_id).values_list("model__name", "effective_mask")
+    return [
+        {"model_name": model_name, "permission": code}
+        for model_name, mask in rows
+        for code in codes_from_mask(mask)
+    ]
+
+
+def get_role_manifest(role_id):
+    """
+    The role's login permission list plus an ETag derived from its content,
+    compiled once per permission version. Roleless users get an empty list.
+    """
+    version = get_permission_version()
+    cached = _role_manifests.get(role_id)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+
+    permissions = role_permission_list(role_id) if role_id else []
+    digest = hashlib.sha1(json.dumps(permissions, sort_keys=True).encode()).hexdigest()
+    etag = f'"{digest[:20]}"'
+    with _lock:
+        _role_manifests[role_id] = (version, etag, permissions)
+    return etag, permissions
+
+
+def _lineage(role_id, parents):
+    """The role followed by its ancestors, nearest first."""
+    chain = []
+    while role_id is not None and role_id not in chain:
+        chain.append(role_id)
+        role_id = parents.get(role_id)
+    return chain
+
+
+def _descendants(role_ids, parents):
+    children = {}
+    for child, parent in parents.items():
+        children.setdefault(parent, []).append(child)
+
+    found = set()
+    stack = list(role_ids)
+    while stack:
+        role_id = stack.pop()
+        if role_id in found:
+            continue
+        found.add(role_id)
+        stack.extend(children.get(role_id, ()))
+    return found
+
+
+def sync_role_matrices(role_ids=None, model_ids=None):
+    """
+    Recompute RolePermissionMatrix rows from RoleModelPermission for the given
+    roles and every role inheriting from them (all roles when None),
+    optionally limited to some models. Both the direct mask and the
+    inherited closure are rewritten, in a constant number of queries.
+    """
+    parents = dict(Role.objects.values_list("id", "parent_id"))
+    affected = set(parents) if role_ids is None else _descendants(role_ids, parents)
+    if not affected:
+        return
+    lineages = {role_id: _lineage(role_id, parents) for role_id in affected}
+
+    grants = RoleModelPermission.objects.filter(
+        role_id__in={ancestor for chain in lineages.values() for ancestor in chain}
+    )
+    existing = RolePermissionMatrix.objects.filter(role_id__in=affected)
+    if model_ids is not None:
+        grants = grants.filter(model_id__in=model_ids)
+        existing = existing.filter(model_id__in=model_ids)
+
+    direct = {}
+    for role_id, model_id, code in grants.values_list("role_id", "model_id", "permission_type__code"):
+        masks = direct.setdefault(role_id, {})
+        masks[model_id] = masks.get(model_id, 0) | PERMISSION_BITS.get(code.lower(), 0)
+
+    wanted = {}
+    for role_id, chain in lineages.items():
+        effective = {}
+        for ancestor in chain:
+            for model_id, mask in direct.get(ancestor, {}).items():
+                effective[model_id] = effective.get(model_id, 0) | mask
+        own = direct.get(role_id, {})
+        for model_id, mask in effective.items():
+            if mask:
+                wanted[(role_id, model_id)] = (own.get(model_id, 0), mask)
+
+    rows = {(row.role_id, row.model_id): row for row in existing}
+    stale = [row.pk for key, row in rows.items() if key not in wanted]
+    changed = []
+    for key, (mask, effective_mask) in wanted.items():
+        row = rows.get(key)
+        if row and (row.mask, row.effective_mask) != (mask, effective_mask):
+            row.mask, row.effective_mask = mask, effective_mask
+            changed.append(row)
+
+    if stale:
+        RolePermissionMatrix.objects.filter(pk__in=stale).delete()
+    if changed:
+        RolePermissionMatrix.objects.bulk_update(changed, ["mask", "effective_mask"])
+    RolePermissionMatrix.objects.bulk_create([
+        RolePermissionMatrix(role_id=role_id, model_id=model_id, mask=mask, effective_mask=effective_mask)
+        for (role_id, model_id), (mask, effective_mask) in wanted.items()
+        if (role_id, model_id) not in rows
+    ])
+
+
+def sync_role_matrix(role_id, model_ids=None):
+    sync_role_matrices([role_id], model_ids)
+
+
+def rebuild_permission_matrices():
+    """Recompute every role's matrix, e.g. after a PermissionType code change."""
+    sync_role_matrices()
+
+
+@contextmanager
+def deferred_matrix_sync():
+    """
+    Batch matrix upkeep for bulk grant changes. Inside the block the per-row
+    signal handlers only record which roles were touched; those roles are
+    resynced and the version bumped once on exit.
+    """
+    if getattr(_deferred, "role_ids", None) is not None:
+        yield
+        return
+
+    _deferred.role_ids = set()
+    try:
+        yield
+        role_ids = _deferred.role_ids
+    finally:
+        _deferred.role_ids = None
+
+    if role_ids:
+        sync_role_matrices(role_ids)
+    bump_permission_version()
+
+
+def is_matrix_sync_deferred():
+    return getattr(_deferred, "role_ids", None) is not None
+
+
+def defer_role_sync(role_id):
+    """Record a touched role when inside deferred_matrix_sync(); returns whether it did."""
+    if not is_matrix_sync_deferred():
+        return False
+    _deferred.role_ids.add(role_id)
+    return True
+
+
+def add_permission_claims(token, role_id):
+    """
+    Embed the role's grants in a simplejwt token as ``{model: mask}`` plus
+    the permission version they were compiled under.
+    """
+    version = get_permission_version()
+    matrix = get_role_matrix(role_id, version) if role_id else {}
+    token[ROLE_CLAIM] = str(role_id) if role_id else None
+    token[PERMISSION_VERSION_CLAIM] = version
+    token[PERMISSIONS_CLAIM] = matrix
+    return token
+
+
+def token_has_permission(token, role_id, model_name, permission_code, version=None):
+    """
+    Authorize from the token's permission claims.
+
+    Returns None when the token carries no claims, was issued for another
+    role, or was compiled under an older permission version; the caller
+    then falls back to the role matrix. ``version`` is the stamp when the
+    caller has already read it. The stamp comes from the per-process copy,
+    so a token with current claims is checked without touching the
+    database, not even to compile a matrix; a grant revoked by another
+    worker stops authorizing within ``PERMISSION_VERSION_TTL`` seconds.
+    """
+    if token is None or not hasattr(token, "get"):
+        return None
+
+    claims = token.get(PERMISSIONS_CLAIM)
+    if claims is None or token.get(ROLE_CLAIM) != str(role_id):
+        return None
+    if version is None:
+        version = get_permission_version()
+    if token.get(PERMISSION_VERSION_CLAIM) != version:
+        return None
+
+    bit = PERMISSION_BITS.get(permission_code.lower(), 0)
+    return bool(claims.get(model_name.lower(), 0) & bit)
+
+
+def clear_permission_cache():
+    with _lock:
+        _role_matrices.clear()
+        _role_manifests.clear()
+    forget_permission_version()
@@ -1,17 +1,19 @@
+from django.conf import settings
 from rest_framework.permissions import BasePermission
-from .models import RoleModelPermission, AppModel, PermissionType
+from .permission_utils import get_permission_version, role_has_permission, token_has_permission
 
 class HasModelPermission(BasePermission):
     def has_permission(self, request, view):
-        
+
         if not request.user or not request.user.is_authenticated:
             return False
-        
+
         if request.user.is_superuser:
             return True
 
-        role = getattr(request.user, 'role', None)
-        if not role:
+        # role_id avoids loading the Role row just to key the matrix
+        role_id = getattr(request.user, 'role_id', None)
+        if not role_id:
             return False
 
         # Auto infer model_name from view's queryset
@@ -24,13 +26,14 @@ class HasModelPermission(BasePermission):
         if not model_name or not permission_code:
             return False
 
-        try:
-            model_obj = AppModel.objects.get(name__iexact=model_name)
-            perm_type = PermissionType.objects.get(code=permission_code.lower())
-            return RoleModelPermission.objects.filter(
-                role=role,
-                model=model_obj,
-                permission_type=perm_type
-            ).exists()
-        except (AppModel.DoesNotExist, PermissionType.DoesNotExist):
-            return False
+        # The per-process copy of the stamp serves both the token and the
+        # matrix; current token claims never need the database
+        version = get_permission_version()
+        if getattr(settings, 'PERMISSION_CLAIMS_IN_TOKEN', False):
+            allowed = token_has_permission(
+                getattr(request, 'auth', None), role_id, model_name, permission_code, version
+            )
+            if allowed is not None:
+                return allowed
+
+        return role_has_permission(role_id, model_name, permission_code, version)
@@ -0,0 +1,20 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views that stream ``text/event-stream`` pass DRF content
+    negotiation. The stream itself bypasses renderers; this only renders the
+    error responses (e.g. 401/403) raised before streaming starts.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
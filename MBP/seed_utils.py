@@ -0,0 +1,285 @@
+"""
+Deterministic synthetic data for ``manage.py seed_dataset``, the benchmark
+database (benchmarks/run.py) and the query-budget harness.
+
+Users are generated in blocks, each with its profiles, attendance, work
+logs, leaves, tasks and audit logs, written with ``bulk_create`` and
+committed per block, so memory stays flat from a thousand users to a
+hundred thousand. The same ``seed`` and sizes always give the same rows
+(dates are relative to today); ``clear_seeded`` removes a previous run,
+slug counters included, so a rerun starts from the same state.
+"""
+import random
+import uuid
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from accounts.models import User
+from HRM.models import Attendance, Leave, Profile, Task, WorkLog
+
+from .audit_utils import rollup_buckets
+from .models import AppModel, AuditLog, AuditLogRollup, PermissionType, Role, RoleModelPermission, SlugCounter
+from .permission_utils import bump_permission_version, rebuild_permission_matrices
+from .slug_utils import allocate_slugs
+
+BENCH_PASSWORD = "bench-password"
+BENCH_EMAIL_DOMAIN = "bench.local"
+
+FIRST_NAMES = ["Aarav", "Diya", "Ishaan", "Kavya", "Rohan", "Saanvi", "Vivaan", "Anaya", "Arjun", "Meera"]
+LAST_NAMES = ["Sharma", "Verma", "Gupta", "Iyer", "Khan", "Patel", "Reddy", "Singh"]
+
+# role name -> (share of models granted, codes granted on them)
+ROLE_GRANTS = {
+    "Admin": (1.0, "crud"),
+    "Manager": (0.5, "cru"),
+    "Staff": (1.0, "r"),
+}
+
+
+PROJECTS = ["Billing", "Onboarding", "Mobile app", "Reporting", "Support", "Infrastructure"]
+
+# Share of working days taken as leave
+LEAVE_RATE = 0.03
+
+
+def seed(users=200, days=30, seed=42, tasks_per_user=2, audit_per_user=20, block=1000, progress=None):
+    """
+    Create ``users`` users with ``days`` days of history. ``progress(users
+    done)`` is called after each committed block. Returns the users.
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        call_command("populate_app_models", stdout=StringIO())
+        roles = seed_roles(rng)
+
+    people = []
+    counts = {"attendance": 0, "tasks": 0}
+    for start in range(0, users, block):
+        with transaction.atomic():
+            batch = seed_users(rng, min(block, users - start), roles, first=start)
+            leaves = seed_leaves(rng, batch, days)
+            counts["attendance"] += seed_attendance(rng, batch, days, skip=leaves, first=counts["attendance"])
+            seed_work_logs(rng, batch, days, skip=leaves)
+            counts["tasks"] += seed_tasks(rng, batch, tasks_per_user, first=counts["tasks"])
+            seed_audit_logs(rng, batch, audit_per_user, days)
+        people.extend(batch)
+        if progress is not None:
+            progress(len(people))
+
+    rebuild_permission_matrices()
+    bump_permission_version()
+    return people
+
+
+def seeded_users():
+    return User.objects.filter(email__endswith=f"@{BENCH_EMAIL_DOMAIN}")
+
+
+def _bulk_delete(queryset):
+    # A plain delete() collects every row first because of the audit
+    # post_delete receiver; these tables have nothing that cascades from them
+    return queryset._raw_delete(router.db_for_write(queryset.model))
+
+
+def clear_seeded():
+    """
+    Delete the synthetic users and everything generated for them, children
+    first in bulk, and the slug counters their names used. Returns the
+    number of rows deleted.
+    """
+    users = seeded_users().values("pk")
+    with transaction.atomic():
+        deleted = sum(_bulk_delete(queryset) for queryset in [
+            AuditLogRollup.objects.filter(user__in=users),
+            AuditLog.objects.filter(user__in=users),
+            Task.objects.filter(assigned_to__in=users),
+            Task.objects.filter(created_by__in=users),
+            Attendance.objects.filter(user__in=users),
+            WorkLog.objects.filter(user__in=users),
+            Leave.objects.filter(user__in=users),
+            Profile.objects.filter(user__in=users),
+        ])
+        # Whatever else points at them (tokens, emails) is small
+        deleted += seeded_users().delete()[0]
+
+        bases = {slugify(f"{first} {last}") for first in FIRST_NAMES for last in LAST_NAMES}
+        deleted += _bulk_delete(SlugCounter.objects.filter(
+            scope__in=[User._meta.label, Profile._meta.label], base__in=bases,
+        ))
+    return deleted
+
+
+def seed_roles(rng):
+    perm_types = {
+        code: PermissionType.objects.get_or_create(code=code, defaults={"name": name})[0]
+        for code, name in [("c", "Create"), ("r", "Read"), ("u", "Update"), ("d", "Delete")]
+    }
+    app_models = list(AppModel.objects.order_by("name"))
+
+    roles = {}
+    grants = []
+    for name, (share, codes) in ROLE_GRANTS.items():
+        role = Role.objects.get_or_create(name=name)[0]
+        roles[name] = role
+        for app_model in app_models[: max(1, int(len(app_models) * share))]:
+            for code in codes:
+                grants.append(RoleModelPermission(role=role, model=app_model, permission_type=perm_types[code]))
+
+    bases = [slugify(f"{g.role.name}-{g.model.name}-{g.permission_type.slug}") for g in grants]
+    for grant, slug in zip(grants, allocate_slugs(RoleModelPermission, bases)):
+        grant.slug = slug
+    RoleModelPermission.objects.bulk_create(grants, ignore_conflicts=True)
+    return roles
+
+
+def seed_users(rng, count, roles, first=0):
+    password = make_password(BENCH_PASSWORD)
+    role_list = [roles["Staff"]] * 8 + [roles["Manager"]] * 2 + [roles["Admin"]]
+
+    names = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(count)]
+    slugs = allocate_slugs(User, [slugify(name) for name in names])
+    people = [
+        User(
+            id=uuid.UUID(int=rng.getrandbits(128), version=4),
+            email=f"user{first + i}@{BENCH_EMAIL_DOMAIN}",
+            full_name=name,
+            slug=slug,
+            password=password,
+            role=rng.choice(role_list),
+            is_active=True,
+            is_email_verified=True,
+            is_phone_verified=True,
+        )
+        for i, (name, slug) in enumerate(zip(names, slugs))
+    ]
+    User.objects.bulk_create(people, batch_size=500)
+
+    profile_slugs = allocate_slugs(Profile, [slugify(name) for name in names])
+    Profile.objects.bulk_create(
+        [
+            Profile(user=person, full_name=person.full_name, slug=slug, delete_code=f"D{first + i:06X}")
+            for i, (person, slug) in enumerate(zip(people, profile_slugs))
+        ],
+        batch_size=500,
+    )
+    return people
+
+
+def _history(days):
+    today = date.today()
+    return [today - timedelta(days=offset) for offset in range(1, days + 1)]
+
+
+def seed_leaves(rng, people, days):
+    """Leave requests on some of the past days; returns {(user id, day)} taken off."""
+    types = [choice for choice, _ in Leave.LEAVE_TYPES]
+    statuses = ["Approved"] * 3 + ["Rejected", "Pending"]
+    rows = [
+        Leave(user=person, date=day, leave_type=rng.choice(types), status=rng.choice(statuses))
+        for person in people
+        for day in _history(days)
+        if rng.random() < LEAVE_RATE
+    ]
+    Leave.objects.bulk_create(rows, batch_size=1000)
+    return {(row.user_id, row.date) for row in rows if row.status == "Approved"}
+
+
+def seed_attendance(rng, people, days, skip=(), first=0):
+    rows = []
+    for person in people:
+        for day in _history(days):
+            if (person.pk, day) in skip:
+                continue
+            check_in = time(9, rng.randrange(0, 45))
+            check_out = time(rng.choice([13, 17, 18]), rng.randrange(0, 60))
+            worked = datetime.combine(day, check_out) - datetime.combine(day, check_in)
+            rows.append(Attendance(
+                user=person,
+                date=day,
+                check_in=check_in,
+                check_out=check_out,
+                uid=f"A{first + len(rows):07X}",
+                working_hours=worked,
+                status="Present" if 8 <= worked.total_seconds() / 3600 <= 9 else "Half Day",
+            ))
+    Attendance.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def seed_work_logs(rng, people, days, skip=()):
+    rows = []
+    for person in people:
+        for day in _history(days):
+            if (person.pk, day) in skip:
+                continue
+            hours = rng.randrange(1, 9)
+            rows.append(WorkLog(
+                user=person,
+                date=day,
+                project=rng.choice(PROJECTS),
+                work="Synthetic work log",
+                time_taken=f"{hours}h",
+                check_in=time(9, 0),
+                check_out=time(9 + hours, 0),
+            ))
+    WorkLog.objects.bulk_create(rows, batch_size=1000)
+
+
+def seed_tasks(rng, people, per_user=2, first=0):
+    statuses = [choice for choice, _ in Task.STATUS_CHOICES]
+    rows = [
+        Task(
+            title=f"Task {first + i}",
+            assigned_to=person,
+            created_by=rng.choice(people),
+            due_date=date.today() + timedelta(days=rng.randrange(1, 30)),
+            status=rng.choice(statuses),
+            uid=f"T{first + i:07X}",
+        )
+        for i, person in enumerate(person for person in people for _ in range(per_user))
+    ]
+    Task.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def seed_audit_logs(rng, people, per_user=20, days=30):
+    actions = ["login", "logout", "create", "update", "delete"]
+    models = ["User", "Attendance", "Task", "Leave", "Role"]
+    now = timezone.now()
+    span = max(days, 1) * 86400
+    rows = [
+        AuditLog(
+            user=person,
+            action=rng.choice(actions),
+            model_name=rng.choice(models),
+            object_id=str(rng.randrange(1, 10_000)),
+            details="Synthetic benchmark entry",
+            timestamp=now - timedelta(seconds=rng.randrange(span)),
+        )
+        for person in people
+        for _ in range(per_user)
+    ]
+    AuditLog.objects.bulk_create(rows, batch_size=1000)
+
+    # The users are new, so none of their rollup buckets exist yet
+    counts = Counter()
+    for row in rows:
+        for granularity, bucket in rollup_buckets(row.timestamp).items():
+            counts[(granularity, bucket, row.action, row.model_name, row.user_id)] += 1
+    AuditLogRollup.objects.bulk_create(
+        [
+            AuditLogRollup(
+                granularity=granularity, bucket=bucket, action=action,
+                model_name=model_name, user_id=user_id, count=count,
+            )
+            for (granularity, bucket, action, model_name, user_id), count in counts.items()
+        ],
+        batch_size=1000,
+    )
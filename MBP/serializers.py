@@ -1,11 +1,20 @@
 from rest_framework import serializers
 from .models import Role, AppModel, PermissionType, RoleModelPermission, AuditLog
+from .permission_utils import _lineage
+from .audit_utils import audit_states
 
 
 class RoleSerializer(serializers.ModelSerializer):
+    parent = serializers.SlugRelatedField(
+        slug_field='slug',
+        queryset=Role.objects.all(),
+        required=False,
+        allow_null=True
+    )
+
     class Meta:
         model = Role
-        fields = ['id', 'name', 'slug', 'description']
+        fields = ['id', 'name', 'slug', 'description', 'parent']
         read_only_fields = ['slug']
 
     def validate_name(self, value):
@@ -14,6 +23,18 @@ class RoleSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("A role with this name already exists.")
         return value
 
+    def validate_parent(self, value):
+        if value is None or not self.instance:
+            return value
+
+        # Walk up from the proposed parent; meeting this role means a cycle.
+        # _lineage stops at a role it has seen, so a loop already stored
+        # elsewhere in the table cannot keep the walk going
+        parents = dict(Role.objects.values_list('id', 'parent_id'))
+        if self.instance.id in _lineage(value.id, parents):
+            raise serializers.ValidationError("A role cannot inherit from itself or its descendants.")
+        return value
+
 
 class AppModelSerializer(serializers.ModelSerializer):
     class Meta:
@@ -130,12 +151,23 @@ class AuditLogSerializer(serializers.ModelSerializer):
         model = AuditLog
         fields = [
             'id', 'user', 'user_email', 'action', 'model_name',
-            'object_id', 'details', 'old_data', 'new_data',
+            'object_id', 'details', 'old_data', 'new_data', 'changes',
             'ip_address', 'user_agent', 'timestamp'
         ]
         read_only_fields = fields
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Diff-mode updates only store changed fields; rebuild the full
+        # snapshots when asked to (the detail view does)
+        if self.context.get('rebuild_states') and instance.changes is not None:
+            data['old_data'], data['new_data'] = audit_states(instance)
+        return data
+
 from django.utils.text import slugify
+from django.db import transaction
+from .slug_utils import allocate_slugs
+from .permission_utils import deferred_matrix_sync, defer_role_sync
 class RolePermissionAssignSerializer(serializers.Serializer):
     # For CREATE and UPDATE
     role_name = serializers.CharField(required=False)
@@ -160,115 +192,135 @@ class RolePermissionAssignSerializer(serializers.Serializer):
         return data
 
     # ------------------------------------------------------------
-    # BULK CREATE (role_name + model_slug + permission_slugs)
+    # SHARED: resolve every model slug / permission code in one query each
     # ------------------------------------------------------------
-    def bulk_create(self, validated_data):
-        role = validated_data["role"]
-        blocks = validated_data["permissions"]
-        
+    def resolve_blocks(self, blocks):
         if not blocks:
             raise serializers.ValidationError({"permissions": "Permissions list cannot be empty."})
 
-        created_slugs = []
-
+        model_slugs = {block["model_slug"] for block in blocks}
+        codes = {code for block in blocks for code in block["permission_slugs"]}
+
+        app_models = {m.slug: m for m in AppModel.objects.filter(slug__in=model_slugs)}
+        missing_models = sorted(model_slugs - app_models.keys())
+        if missing_models:
+            raise serializers.ValidationError(
+                {"model_slug": f"Invalid model slug: {missing_models[0]}. This model does not exist."}
+            )
+
+        perm_types = {}
+        for perm in PermissionType.objects.filter(code__in=codes):
+            perm_types.setdefault(perm.code, perm)
+        missing_codes = sorted(codes - perm_types.keys())
+        if missing_codes:
+            raise serializers.ValidationError(
+                {"permission_slugs": f"Invalid permission: {missing_codes[0]}"}
+            )
+
+        wanted = {}
         for block in blocks:
-            model_slug = block["model_slug"]
-            perm_slugs = block["permission_slugs"]
-
-            app_model = AppModel.objects.get(slug=model_slug)
-            
-            if not app_model:
-                raise serializers.ValidationError(
-                    {"model_slug": f"Invalid model slug: {model_slug}. This model does not exist."}
-                )
+            app_model = app_models[block["model_slug"]]
+            wanted.setdefault(app_model, set()).update(
+                perm_types[code] for code in block["permission_slugs"]
+            )
+        return wanted
+
+    def build_permissions(self, role, pairs):
+        objs = [
+            RoleModelPermission(role=role, model=app_model, permission_type=perm)
+            for app_model, perm in pairs
+        ]
+        if not objs:
+            return objs
 
-            for code in perm_slugs:
-                perm = PermissionType.objects.get(code=code)
-                
-                if not perm:
-                    raise serializers.ValidationError(
-                        {"permission_slugs": f"Invalid permission: {code}"}
-                    )
-
-                obj, created = RoleModelPermission.objects.get_or_create(
-                    role=role,
-                    model=app_model,
-                    permission_type=perm
-                )
-                if created:
-                    created_slugs.append(obj.slug)
+        bases = [
+            slugify(f"{role.name}-{obj.model.name}-{obj.permission_type.slug}")
+            for obj in objs
+        ]
+        for obj, slug in zip(objs, allocate_slugs(RoleModelPermission, bases)):
+            obj.slug = slug
+        return objs
 
-        return {"created": created_slugs}
+    # ------------------------------------------------------------
+    # BULK CREATE (role_name + model_slug + permission_slugs)
+    # ------------------------------------------------------------
+    def bulk_create(self, validated_data):
+        role = validated_data["role"]
+        wanted = self.resolve_blocks(validated_data["permissions"])
+
+        with transaction.atomic(), deferred_matrix_sync():
+            existing = set(
+                RoleModelPermission.objects.filter(
+                    role=role, model__in=list(wanted)
+                ).values_list("model_id", "permission_type_id")
+            )
+            missing = [
+                (app_model, perm)
+                for app_model, perms in wanted.items()
+                for perm in perms
+                if (app_model.id, perm.id) not in existing
+            ]
+            objs = self.build_permissions(role, missing)
+            RoleModelPermission.objects.bulk_create(objs, ignore_conflicts=True)
+            defer_role_sync(role.id)
+
+        return {"created": [obj.slug for obj in objs]}
 
     # ------------------------------------------------------------
     # BULK UPDATE (incremental — add/remove permissions)
     # ------------------------------------------------------------
     def bulk_update(self, validated_data):
         role = validated_data["role"]
-        blocks = validated_data["permissions"]
-
-        updated_slugs = []
-        removed_slugs = []
-        
-        if not blocks:
-            raise serializers.ValidationError({"permissions": "Permissions list cannot be empty."})
-
-        for block in blocks:
-            model_slug = block["model_slug"]
-            new_codes = block["permission_slugs"]
-
-            app_model = AppModel.objects.get(slug=model_slug)
-            if not app_model:
-                raise serializers.ValidationError(
-                    {"model_slug": f"Invalid model slug: {model_slug}. This model does not exist."}
-                )
-
-            # Existing permissions for that role + model
-            existing = RoleModelPermission.objects.filter(role=role, model=app_model)
-            existing_codes = {p.permission_type.code: p for p in existing}
-
-            # Add missing permissions
-            for code in new_codes:
-                if code not in existing_codes:
-                    perm = PermissionType.objects.get(code=code)
-                    
-                    if not perm:
-                        raise serializers.ValidationError(
-                            {"permission_slugs": f"Invalid permission: {code}"}
-                        )
-                        
-                    obj = RoleModelPermission.objects.create(
-                        role=role, model=app_model, permission_type=perm
-                    )
-                    updated_slugs.append(obj.slug)
-
-            # Remove permissions not needed anymore
-            for code, obj in existing_codes.items():
-                if code not in new_codes:
-                    removed_slugs.append(obj.slug)
-                    obj.delete()
-
-        return {"updated": updated_slugs, "removed": removed_slugs}
+        wanted = self.resolve_blocks(validated_data["permissions"])
+        wanted_codes = {
+            app_model.id: {perm.code for perm in perms}
+            for app_model, perms in wanted.items()
+        }
+
+        with transaction.atomic(), deferred_matrix_sync():
+            existing = RoleModelPermission.objects.filter(
+                role=role, model__in=list(wanted)
+            ).values_list("id", "slug", "model_id", "permission_type__code")
+
+            existing_codes = set()
+            removed = []
+            for pk, slug, model_id, code in existing:
+                existing_codes.add((model_id, code))
+                if code not in wanted_codes[model_id]:
+                    removed.append((pk, slug))
+
+            missing = [
+                (app_model, perm)
+                for app_model, perms in wanted.items()
+                for perm in perms
+                if (app_model.id, perm.code) not in existing_codes
+            ]
+            objs = self.build_permissions(role, missing)
+            RoleModelPermission.objects.bulk_create(objs, ignore_conflicts=True)
+            if removed:
+                RoleModelPermission.objects.filter(pk__in=[pk for pk, _ in removed]).delete()
+            defer_role_sync(role.id)
+
+        return {
+            "updated": [obj.slug for obj in objs],
+            "removed": [slug for _, slug in removed],
+        }
 
     # ------------------------------------------------------------
     # BULK DELETE using slugs
     # ------------------------------------------------------------
     def bulk_delete(self, validated_data):
         slugs = validated_data["slugs"]
-        removed = []
-        
+
         if not slugs:
             raise serializers.ValidationError({"slugs": "List of slugs cannot be empty."})
 
-        for slug in slugs:
-            try:
-                obj = RoleModelPermission.objects.get(slug=slug)
-                obj.delete()
-                removed.append(slug)
-            except RoleModelPermission.DoesNotExist:
-                continue
+        with transaction.atomic(), deferred_matrix_sync():
+            matched = RoleModelPermission.objects.filter(slug__in=slugs)
+            found = set(matched.values_list("slug", flat=True))
+            matched.delete()
 
-        return {"deleted": removed}
+        return {"deleted": [slug for slug in dict.fromkeys(slugs) if slug in found]}
     
 
 # {
@@ -1,8 +1,18 @@
-from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from .models import AuditLog
+from django.conf import settings
+from .models import AuditLog, Role, AppModel, PermissionType, RoleModelPermission
 from .utils import log_audit_from_user
 from .utils import serialize_instance
+from .audit_utils import diff_snapshots
+from .permission_utils import (
+    bump_permission_version,
+    sync_role_matrix,
+    sync_role_matrices,
+    rebuild_permission_matrices,
+    defer_role_sync,
+    is_matrix_sync_deferred,
+)
 
 
 @receiver(post_save)
@@ -12,7 +22,6 @@ def log_create_or_update(sender, instance, created, **kwargs):
 
     user = getattr(instance, '_request_user', None)
     if not user:
-        print("No _request_user found. Skipping.")
         return
 
     model_name = sender.__name__
@@ -29,6 +38,15 @@ def log_create_or_update(sender, instance, created, **kwargs):
             details=f"Created {model_name}",
             new_data=new_data
         )
+    elif old_data is not None and settings.AUDIT_LOG_UPDATE_MODE == 'diff':
+        log_audit_from_user(
+            user=user,
+            action='update',
+            model_name=model_name,
+            object_id=object_id,
+            details=f"Updated {model_name}",
+            changes=diff_snapshots(old_data, new_data)
+        )
     else:
         log_audit_from_user(
             user=user,
@@ -62,3 +80,75 @@ def log_deletion(sender, instance, **kwargs):
         details=f"Signal: Deleted {model_name}: {instance}",
         old_data=old_data
     )
+
+
+@receiver(pre_save, sender=RoleModelPermission)
+def remember_previous_grant(sender, instance, **kwargs):
+    # An edited grant may move to another role/model; remember where it was
+    # so that matrix row is recomputed as well.
+    if not instance._state.adding:
+        instance._previous_grant = sender.objects.filter(pk=instance.pk).values_list(
+            'role_id', 'model_id'
+        ).first()
+
+
+@receiver([post_save, post_delete], sender=RoleModelPermission)
+def sync_permission_matrix(sender, instance, **kwargs):
+    if defer_role_sync(instance.role_id):
+        return
+
+    previous = getattr(instance, '_previous_grant', None)
+    if previous and previous != (instance.role_id, instance.model_id):
+        sync_role_matrix(previous[0], [previous[1]])
+    sync_role_matrix(instance.role_id, [instance.model_id])
+
+
+@receiver(pre_save, sender=Role)
+def remember_previous_parent(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._previous_parent_id = sender.objects.filter(pk=instance.pk).values_list(
+            'parent_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Role)
+def sync_inherited_permissions(sender, instance, created, **kwargs):
+    # Only a new or changed parent link alters the inherited closure
+    previous = None if created else getattr(instance, '_previous_parent_id', None)
+    if instance.parent_id == previous:
+        return
+    if defer_role_sync(instance.id):
+        return
+    sync_role_matrix(instance.id)
+
+
+@receiver(pre_delete, sender=Role)
+def remember_child_roles(sender, instance, **kwargs):
+    instance._child_ids = list(instance.children.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Role)
+def sync_orphaned_roles(sender, instance, **kwargs):
+    # Children were detached (SET_NULL) and no longer inherit these grants
+    child_ids = getattr(instance, '_child_ids', None)
+    if child_ids:
+        sync_role_matrices(child_ids)
+
+
+@receiver(post_save, sender=PermissionType)
+def resync_matrices_for_permission_type(sender, instance, created, **kwargs):
+    # Masks are derived from the code, which may have been edited
+    if not created:
+        rebuild_permission_matrices()
+
+
+# Must stay below the matrix sync receivers so the version only moves once the
+# matrix rows are current.
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=AppModel)
+@receiver([post_save, post_delete], sender=PermissionType)
+@receiver([post_save, post_delete], sender=RoleModelPermission)
+def invalidate_permission_matrices(sender, **kwargs):
+    if is_matrix_sync_deferred():
+        return
+    bump_permission_version()
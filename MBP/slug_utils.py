@@ -0,0 +1,108 @@
+"""
+Unique slug allocation shared by every model with a slug field.
+
+Instead of probing ``while Model.objects.filter(slug=...).exists()`` until a
+free suffix turns up, each (model, base slug) pair keeps its next free suffix
+in SlugCounter. Allocating one slug or a whole batch for ``bulk_create`` takes
+a constant number of queries, whatever the number of existing duplicates.
+Slugs follow the existing ``base``, ``base-1``, ``base-2``... pattern.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import SlugCounter
+
+
+def _format_slug(base, value):
+    return base if value == 0 else f"{base}-{value}"
+
+
+def _next_free_values(model, field, bases):
+    """
+    Seed counters for bases seen for the first time from the slugs already
+    in the table (one query for all bases).
+    """
+    taken_filter = Q()
+    for base in bases:
+        taken_filter |= Q(**{field: base}) | Q(**{f"{field}__startswith": f"{base}-"})
+
+    next_values = dict.fromkeys(bases, 0)
+    for slug in model._default_manager.filter(taken_filter).values_list(field, flat=True).iterator():
+        if slug in next_values:
+            next_values[slug] = max(next_values[slug], 1)
+            continue
+        base, _, suffix = slug.rpartition("-")
+        if base in next_values and suffix.isdigit():
+            next_values[base] = max(next_values[base], int(suffix) + 1)
+    return next_values
+
+
+def _reserve(model, field, wanted):
+    """Reserve ``wanted[base]`` consecutive suffixes per base; returns start values."""
+    scope = model._meta.label
+    counters = {
+        counter.base: counter
+        for counter in SlugCounter.objects.select_for_update().filter(scope=scope, base__in=list(wanted))
+    }
+    new_bases = [base for base in wanted if base not in counters]
+    seeded = _next_free_values(model, field, new_bases) if new_bases else {}
+
+    starts = {}
+    for base, count in wanted.items():
+        counter = counters.get(base)
+        if counter:
+            starts[base] = counter.next_value
+            counter.next_value += count
+        else:
+            starts[base] = seeded[base]
+
+    if counters:
+        SlugCounter.objects.bulk_update(list(counters.values()), ["next_value"])
+    if new_bases:
+        SlugCounter.objects.bulk_create([
+            SlugCounter(scope=scope, base=base, next_value=seeded[base] + wanted[base])
+            for base in new_bases
+        ])
+    return starts
+
+
+def allocate_slugs(model, bases, field="slug"):
+    """
+    Return one unique slug per entry of ``bases`` (in order), e.g. to
+    pre-assign slugs before ``bulk_create``. Duplicate bases get consecutive
+    suffixes.
+    """
+    bases = list(bases)
+    slugs = [None] * len(bases)
+    pending = list(range(len(bases)))
+
+    while pending:
+        wanted = Counter(bases[i] for i in pending)
+        try:
+            with transaction.atomic():
+                starts = _reserve(model, field, wanted)
+        except IntegrityError:
+            # Another process seeded the same counter first; it exists now.
+            with transaction.atomic():
+                starts = _reserve(model, field, wanted)
+
+        for i in pending:
+            base = bases[i]
+            slugs[i] = _format_slug(base, starts[base])
+            starts[base] += 1
+
+        # Slugs set by hand after a counter was seeded can still collide;
+        # those (rare) entries simply draw the next suffix.
+        candidates = {slugs[i]: i for i in pending}
+        clashes = model._default_manager.filter(
+            **{f"{field}__in": list(candidates)}
+        ).values_list(field, flat=True)
+        pending = sorted(candidates[slug] for slug in clashes)
+
+    return slugs
+
+
+def allocate_slug(model, base, field="slug"):
+    return allocate_slugs(model, [base], field)[0]
@@ -1,6 +1,6 @@
 from rest_framework import routers
 from django.urls import path, include
-from .views import RoleViewSet, AppModelViewSet, PermissionTypeViewSet, RoleModelPermissionViewSet, AuditLogViewSet, RoleModelPermissionBulkViewSet
+from .views import RoleViewSet, AppModelViewSet, PermissionTypeViewSet, RoleModelPermissionViewSet, AuditLogViewSet, RoleModelPermissionBulkViewSet, metrics_view
 
 router = routers.DefaultRouter()
 router.register(r'roles', RoleViewSet)
@@ -12,4 +12,5 @@ router.register('logs', AuditLogViewSet, basename='auditlog')
 
 urlpatterns = [
     path('api/', include(router.urls)),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,42 +1,92 @@
 from .models import AuditLog
-from django.core.serializers.json import DjangoJSONEncoder
-from django.db.models.fields.files import FileField, ImageField
+from .audit_utils import audit_writer
+from django.utils import timezone
+from django.db import models
+from django.db.models.fields.files import FileField
 from django.db.models import Model
+from django.utils.functional import Promise
 from decimal import Decimal
-import json
 import uuid
 import datetime
 
 
-def serialize_instance(instance):
-    data = {}
-    for field in instance._meta.fields:
-        field_name = field.name
-        value = getattr(instance, field_name, None)
+# Field types whose values serialize_instance keeps as they are
+_PLAIN_FIELDS = (
+    models.CharField,
+    models.TextField,
+    models.IntegerField,
+    models.BooleanField,
+    models.FloatField,
+    models.TimeField,
+    models.DurationField,
+    models.JSONField,
+    models.GenericIPAddressField,
+)
+
+# Values DjangoJSONEncoder can encode without help
+_ENCODABLE = (str, int, float, list, tuple, dict, datetime.time, datetime.timedelta, Promise)
+
+_plans = {}  # model class -> ((field name, converter), ...)
+
+
+def _as_is(value):
+    return value
+
+
+def _file_url(value):
+    return value.url if value else None
 
-        if isinstance(field, (FileField, ImageField)):
-            data[field_name] = value.url if value else None
 
-        elif isinstance(value, (uuid.UUID, datetime.datetime, datetime.date)):
-            data[field_name] = str(value)
+def _as_str(value):
+    return None if value is None else str(value)
 
-        elif isinstance(value, Decimal):
-            # Convert Decimal to float for JSON serialization
-            data[field_name] = float(value)
 
-        elif isinstance(value, Model):
-            data[field_name] = str(value)
+def _decimal(value):
+    # Convert Decimal to float for JSON serialization
+    return float(value) if isinstance(value, Decimal) else value
 
-        else:
-            try:
-                json.dumps(value, cls=DjangoJSONEncoder)
-                data[field_name] = value
-            except (TypeError, ValueError):
-                data[field_name] = str(value)
 
-    return data
+def _coerce(value):
+    """Fallback for field types without a dedicated converter."""
+    if isinstance(value, (uuid.UUID, datetime.datetime, datetime.date)):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Model):
+        return str(value)
+    if value is None or isinstance(value, _ENCODABLE):
+        return value
+    return str(value)
 
 
+def _converter(field):
+    if isinstance(field, FileField):
+        return _file_url
+    if field.is_relation:
+        return _as_str
+    if isinstance(field, (models.UUIDField, models.DateField)):
+        return _as_str
+    if isinstance(field, models.DecimalField):
+        return _decimal
+    if isinstance(field, _PLAIN_FIELDS):
+        return _as_is
+    return _coerce
+
+
+def serialization_plan(model):
+    """``(field name, converter)`` pairs for the model, built on first use."""
+    plan = _plans.get(model)
+    if plan is None:
+        plan = _plans[model] = tuple((field.name, _converter(field)) for field in model._meta.fields)
+    return plan
+
+
+def serialize_instance(instance):
+    return {
+        field_name: convert(getattr(instance, field_name, None))
+        for field_name, convert in serialization_plan(type(instance))
+    }
+
 
 def get_client_ip(request):
     x_forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -46,33 +96,29 @@ def get_user_agent(request):
     return request.META.get('HTTP_USER_AGENT', '')
 
 def log_audit(request, action, model_name=None, object_id=None, details=None, old_data=None, new_data=None):
-    print(f"3.1 Calling log_audit_from_user for {model_name}, action: {action}")
-    try:
-        AuditLog.objects.create(
-            user=request.user if request and request.user.is_authenticated else None,
-            action=action,
-            model_name=model_name,
-            object_id=str(object_id) if object_id else None,
-            details=details,
-            old_data=old_data,
-            new_data=new_data,
-            ip_address=get_client_ip(request) if request else None,
-            user_agent=get_user_agent(request) if request else None
-        )
-    except Exception as e:
-        print("Failed to create audit log:", e)
-
-def log_audit_from_user(user, action, model_name=None, object_id=None, details=None, old_data=None, new_data=None):
-    print(f"3.2 Calling log_audit_from_user for {model_name}, action: {action}")
-    try:
-        AuditLog.objects.create(
-            user=user,
-            action=action,
-            model_name=model_name,
-            object_id=str(object_id) if object_id else None,
-            details=details,
-            old_data=old_data,
-            new_data=new_data
-        )
-    except Exception as e:
-        print(" Failed to create audit log:", e)
+    user = getattr(request, 'user', None)
+    audit_writer.submit(AuditLog(
+        user=user if user is not None and user.is_authenticated else None,
+        action=action,
+        model_name=model_name,
+        object_id=str(object_id) if object_id else None,
+        details=details,
+        old_data=old_data,
+        new_data=new_data,
+        ip_address=get_client_ip(request) if request else None,
+        user_agent=get_user_agent(request) if request else None,
+        timestamp=timezone.now(),
+    ))
+
+def log_audit_from_user(user, action, model_name=None, object_id=None, details=None, old_data=None, new_data=None, changes=None):
+    audit_writer.submit(AuditLog(
+        user=user if getattr(user, 'pk', None) else None,
+        action=action,
+        model_name=model_name,
+        object_id=str(object_id) if object_id else None,
+        details=details,
+        old_data=old_data,
+        new_data=new_data,
+        changes=changes,
+        timestamp=timezone.now(),
+    ))
@@ -1,6 +1,6 @@
 from rest_framework import viewsets
 from .permissions import HasModelPermission
-from .models import Role, AppModel, PermissionType, RoleModelPermission, AuditLog
+from .models import Role, AppModel, PermissionType, RoleModelPermission, AuditLog, AuditLogRollup
 from .serializers import (
     RoleSerializer,
     AppModelSerializer,
@@ -9,12 +9,29 @@ from .serializers import (
     AuditLogSerializer
 )
 from .utils import serialize_instance
+from .pagination import KeysetPagination
+from .archive_utils import archived_horizon, archived_rows, find_archived
+from .audit_utils import audit_feed
+from .health_utils import health_sampler
+from .metrics_utils import request_metrics
+from .renderers import EventStreamRenderer
+from rest_framework.renderers import JSONRenderer
+from django.conf import settings
+import time
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.core.serializers.json import DjangoJSONEncoder
+import csv
+import json
+from django.utils.dateparse import parse_datetime
+import uuid
 from django.db.models.signals import post_save
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Q
-import psutil
+from django.db.models import Max, Q, Sum
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils.timesince import timesince
 from django.utils import timezone
 from django.contrib.auth import get_user_model
@@ -219,20 +236,62 @@ class RoleModelPermissionBulkViewSet(ProtectedModelViewSet):
         return Response(result)
 
 
+class _Echo:
+    """File-like object for csv.writer: hands each formatted line back."""
+    def write(self, value):
+        return value
+
+
 class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Read-only audit logs view with role-based data filtering.
     - Superusers → all logs
     - Admins → logs of users they created
     - Others → only their own logs
-    Supports filters: ?user=email&action=create
+    Newest first, keyset-paginated (follow ``next``; ``page_size`` up to 500).
+    Indexed exact filters: ?user_id=<uuid>&action=create&model_name=Task&object_id=42
+    Time range: ?since=<ISO datetime>&until=<ISO datetime>
+    ?user=<email fragment> is still accepted but cannot use an index.
+
+    Rows moved to cold storage by ``archive_audit_logs`` are still listed and
+    retrievable; the archive is only read once a listing runs past the rows
+    left in the table and its time range reaches the archived months.
     """
-    queryset = AuditLog.objects.all().order_by('-timestamp')
+    queryset = AuditLog.objects.select_related('user').order_by('-timestamp', '-id')
     serializer_class = AuditLogSerializer
+    pagination_class = KeysetPagination
     model_name = 'AuditLog'
     permission_classes = [HasModelPermission]
     permission_code = 'r'
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['rebuild_states'] = self.action == 'retrieve'
+        return context
+
+    def get_log_filters(self):
+        params = self.request.query_params
+        exact = {
+            'user_id': params.get('user_id'),
+            'action': (params.get('action') or '').lower(),  # choices are lowercase
+            'model_name': params.get('model_name'),
+            'object_id': params.get('object_id'),
+        }
+        time_range = {}
+        for name in ('since', 'until'):
+            try:
+                moment = parse_datetime(params.get(name) or '')
+            except ValueError:  # well formed but out of range, e.g. month 13
+                raise serializers.ValidationError({name: "Not a valid date and time."})
+            if moment is not None:
+                time_range[name] = moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+        return {field: value for field, value in exact.items() if value}, time_range, params.get('user')
+
+    def visible_users(self):
+        # Normal users see their own logs and logs of users they created
+        user = self.request.user
+        return User.objects.filter(Q(pk=user.pk) | Q(created_by=user)).values('pk')
+
     def get_queryset(self):
         user = self.request.user
         queryset = super().get_queryset()
@@ -241,57 +300,327 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
             return queryset.none()
 
         # Superusers see everything
-        if user.is_superuser:
-            return queryset
-
-        # Normal users see their own logs and logs of users they created
-        created_users = user.created_users.all()
-        queryset = queryset.filter(Q(user=user) | Q(user__in=created_users))
+        if not user.is_superuser:
+            queryset = queryset.filter(user_id__in=self.visible_users())
 
         # Optional filters
-        user_email = self.request.query_params.get("user")
-        action = self.request.query_params.get("action")
-
+        exact, time_range, user_email = self.get_log_filters()
+        try:
+            queryset = queryset.filter(**exact)
+        except DjangoValidationError:  # malformed user_id
+            return queryset.none()
+        if 'since' in time_range:
+            queryset = queryset.filter(timestamp__gte=time_range['since'])
+        if 'until' in time_range:
+            queryset = queryset.filter(timestamp__lt=time_range['until'])
         if user_email:
             queryset = queryset.filter(user__email__icontains=user_email)
-        if action:
-            queryset = queryset.filter(action__iexact=action)
 
         return queryset
 
+    def archive_match(self):
+        """The list filters as a predicate over archived row dicts (None: nothing can match)."""
+        exact, _, user_email = self.get_log_filters()
+        if 'user_id' in exact:
+            try:
+                exact['user_id'] = str(uuid.UUID(exact['user_id']))
+            except ValueError:
+                return None
+
+        allowed_users = []
+        if not self.request.user.is_superuser:
+            allowed_users.append({str(pk) for pk in self.visible_users().values_list('pk', flat=True)})
+        if user_email:
+            matching = User.objects.filter(email__icontains=user_email).values_list('pk', flat=True)
+            allowed_users.append({str(pk) for pk in matching})
+
+        def match(row):
+            return (
+                all(row.get(field) == value for field, value in exact.items())
+                and all(row['user_id'] in users for users in allowed_users)
+            )
+        return match
+
+    def get_cold_rows(self, position, limit):
+        horizon = archived_horizon()
+        _, time_range, _ = self.get_log_filters()
+        if horizon is None or ('since' in time_range and time_range['since'] >= horizon):
+            return []
+        if not self.request.user.is_authenticated:
+            return []
+
+        match = self.archive_match()
+        if match is None:
+            return []
+        rows = archived_rows(
+            since=time_range.get('since'),
+            until=time_range.get('until'),
+            before=position,
+            match=match,
+            limit=limit,
+        )
+        self.attach_users(rows)
+        return rows
+
+    def attach_users(self, rows):
+        users = User.objects.in_bulk({row.user_id for row in rows if row.user_id})
+        for row in rows:
+            row.user = users.get(uuid.UUID(str(row.user_id))) if row.user_id else None
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            entry = find_archived(kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+            match = self.archive_match() if entry is not None else None
+            fields = ('user_id', 'action', 'model_name', 'object_id')
+            if entry is None or match is None or not match({f: getattr(entry, f) for f in fields}):
+                raise
+            self.attach_users([entry])
+            return Response(self.get_serializer(entry).data)
+
+    EXPORT_FIELDS = [
+        'id', 'timestamp', 'user_id', 'user__email', 'action', 'model_name', 'object_id',
+        'details', 'old_data', 'new_data', 'changes', 'ip_address', 'user_agent',
+    ]
+    EXPORT_JSON_FIELDS = {'old_data', 'new_data', 'changes'}
+
+    @action(detail=False, methods=["get"], url_path="export")
+    def export(self, request):
+        """
+        Streams every visible log matching the list filters, newest first.
+        ?output=ndjson (default) or ?output=csv. Rows are read in chunks and
+        written as they are produced, so memory use does not grow with the
+        export size. Archived rows are not included.
+        """
+        output = request.query_params.get('output', 'ndjson').lower()
+        if output not in ('ndjson', 'csv'):
+            return Response({"error": "output must be 'ndjson' or 'csv'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = self.get_queryset().values_list(*self.EXPORT_FIELDS).iterator(chunk_size=2000)
+        columns = ['user_email' if field == 'user__email' else field for field in self.EXPORT_FIELDS]
+        if output == 'csv':
+            stream, content_type = self._csv_lines(columns, rows), 'text/csv'
+        else:
+            stream, content_type = self._ndjson_lines(columns, rows), 'application/x-ndjson'
+
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        filename = f"auditlogs-{timezone.now():%Y%m%d-%H%M%S}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def _ndjson_lines(self, columns, rows):
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + "\n"
+
+    def _csv_lines(self, columns, rows):
+        writer = csv.writer(_Echo())
+        json_positions = [i for i, field in enumerate(self.EXPORT_FIELDS) if field in self.EXPORT_JSON_FIELDS]
+        yield writer.writerow(columns)
+        for row in rows:
+            row = list(row)
+            for i in json_positions:
+                if row[i] is not None:
+                    row[i] = json.dumps(row[i], cls=DjangoJSONEncoder)
+            yield writer.writerow(row)
+
+    ACTIVITY_GROUPS = {'action': 'action', 'model': 'model_name', 'user': 'user__email'}
+
+    @action(detail=False, methods=["get"], url_path="activity")
+    def activity(self, request):
+        """
+        Audit activity counts for charts, read from AuditLogRollup buckets.
+        ?granularity=hour (default, last 24 hours) or day (last 30 days),
+        ?since/?until to pick another range, ?group_by=action|model|user to
+        split the series, and the exact action/model_name/user_id filters.
+        """
+        granularity = request.query_params.get('granularity', AuditLogRollup.HOUR)
+        if granularity not in (AuditLogRollup.HOUR, AuditLogRollup.DAY):
+            return Response({"error": "granularity must be 'hour' or 'day'"}, status=status.HTTP_400_BAD_REQUEST)
+        group_by = request.query_params.get('group_by')
+        if group_by and group_by not in self.ACTIVITY_GROUPS:
+            return Response(
+                {"error": f"group_by must be one of: {', '.join(self.ACTIVITY_GROUPS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        exact, time_range, _ = self.get_log_filters()
+        if granularity == AuditLogRollup.HOUR:
+            bucket_span, default_range = timezone.timedelta(hours=1), timezone.timedelta(hours=24)
+        else:
+            bucket_span, default_range = timezone.timedelta(days=1), timezone.timedelta(days=30)
+        until = time_range.get('until', timezone.now())
+        since = time_range.get('since', until - default_range)
+
+        rollups = AuditLogRollup.objects.filter(
+            granularity=granularity,
+            # A bucket that starts before `since` still overlaps the range
+            bucket__gt=since - bucket_span,
+            bucket__lt=until,
+        )
+        if not request.user.is_superuser:
+            rollups = rollups.filter(user_id__in=self.visible_users())
+        try:
+            rollups = rollups.filter(**{
+                field: value for field, value in exact.items() if field in ('action', 'model_name', 'user_id')
+            })
+        except DjangoValidationError:  # malformed user_id
+            rollups = rollups.none()
+
+        fields = ['bucket'] + ([self.ACTIVITY_GROUPS[group_by]] if group_by else [])
+        series = [
+            {
+                'bucket': row['bucket'],
+                **({group_by: row[self.ACTIVITY_GROUPS[group_by]]} if group_by else {}),
+                'count': row['total'],
+            }
+            for row in rollups.values(*fields).annotate(total=Sum('count')).order_by(*fields)
+        ]
+        return Response({'granularity': granularity, 'since': since, 'until': until, 'series': series})
+
     @action(detail=False, methods=["get"], url_path="recent")
     def recent_logs(self, request):
         """
         Returns 5 most recent activities with "time ago" format.
+        Served from this process's in-memory audit feed, without queries,
+        when it holds five events the user may see.
         """
-        logs = self.get_queryset()[:5]
+        now = timezone.now()
+        events = audit_feed.recent(5, viewer=request.user)
+        if len(events) < 5:
+            # The feed only keeps this process's newest events; the user's own
+            # may have scrolled out of it or been written by another worker
+            events = [
+                {
+                    "action": log.action,
+                    "details": log.details or "",
+                    "timestamp": log.timestamp,
+                    "user": log.user.full_name if log.user else None,
+                }
+                for log in self.get_queryset().select_related('user')[:5]
+            ]
         data = [
             {
-                "action": log.action,
-                "details": log.details or "",
-                "time_ago": timesince(log.timestamp, timezone.now()) + " ago",
-                "user": log.user.full_name if log.user else None,
+                "action": event["action"],
+                "details": event["details"],
+                "time_ago": timesince(event["timestamp"], now) + " ago",
+                "user": event["user"],
             }
-            for log in logs
+            for event in events
         ]
         return Response(data, status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=["get"], url_path="system-health", permission_classes=[])
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="live",
+        renderer_classes=[EventStreamRenderer, JSONRenderer],
+    )
+    def live(self, request):
+        """
+        Server-sent events feed of new audit events visible to the user.
+        Read from the AuditLog table, so events written by every worker
+        arrive, not only this process's. Each event carries its AuditLog id
+        as the SSE id, so a reconnecting EventSource resumes after
+        Last-Event-ID.
+
+        Every connection holds a worker, so the stream is a short poll: the
+        table is checked every AUDIT_FEED_POLL_SECONDS (at once when this
+        process writes an event), and after AUDIT_FEED_STREAM_SECONDS the
+        stream ends and the client reconnects. It streams under WSGI; under
+        ASGI Django buffers the whole response, so the events of one window
+        arrive together when it ends.
+        """
+        try:
+            after = int(request.headers.get("Last-Event-ID") or request.query_params.get("after") or 0)
+        except ValueError:
+            after = 0
+        if after <= 0:
+            after = AuditLog.objects.aggregate(last=Max("pk"))["last"] or 0
+
+        response = StreamingHttpResponse(
+            self._event_stream(self.get_queryset(), after),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _event_stream(self, queryset, after):
+        deadline = time.monotonic() + settings.AUDIT_FEED_STREAM_SECONDS
+        poll = getattr(settings, "AUDIT_FEED_POLL_SECONDS", 2.0)
+        seq = audit_feed.last_seq
+        yield "retry: 3000\n\n"
+        while True:
+            logs = list(queryset.filter(pk__gt=after).order_by("pk")[:100])
+            if not logs:
+                yield ": keep-alive\n\n"
+            for log in logs:
+                after = log.pk
+                event = {
+                    "id": log.pk,
+                    "action": log.action,
+                    "model_name": log.model_name,
+                    "object_id": log.object_id,
+                    "details": log.details or "",
+                    "user": log.user.full_name if log.user else None,
+                    "user_id": str(log.user_id) if log.user_id else None,
+                    "timestamp": log.timestamp,
+                }
+                yield f"id: {log.pk}\nevent: audit\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # Events written by this process wake the stream early; those of
+            # other workers are picked up by the next poll
+            _, seq = audit_feed.wait(seq, min(poll, remaining))
+
+    @action(detail=False, methods=["get"], url_path="system-health", permission_classes=[IsAuthenticated])
     def system_health(self, request):
         """
         Returns current system health information for dashboard display.
+        Answered from the background sampler's latest snapshot. Staff also
+        get this worker's process stats, and with ?history=1 the recent
+        samples as a time series. Until the sampler's first snapshot (about
+        a second after the worker's first call) it answers 503.
         """
-        cpu_usage = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage("/")
+        health_sampler.ensure_started()
+        snapshot = health_sampler.latest()
+        if snapshot is None:
+            # Sampling here would measure CPU over a window of microseconds
+            return Response(
+                {"server_status": "Starting", "detail": "No health sample yet, retry shortly."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+        cpu_usage = snapshot["cpu_percent"]
 
         health_data = {
             "server_status": "Online" if cpu_usage < 90 else "High Load",
-            "database": "Healthy",  # Optionally, add a DB connection check
+            "database": "Healthy" if snapshot["db_ok"] else "Unavailable",
             "ai_services": "Active",  # For AI/ML modules, can be checked via API ping
-            "uptime": timesince(timezone.now() - timezone.timedelta(seconds=psutil.boot_time())),
+            "uptime": timesince(snapshot["boot_time"]),
             "cpu_usage": f"{cpu_usage}%",
-            "memory_usage": f"{memory.percent}%",
-            "disk_usage": f"{disk.percent}%",
+            "memory_usage": f"{snapshot['memory_percent']}%",
+            "disk_usage": f"{snapshot['disk_percent']}%",
+            "db_latency_ms": snapshot["db_latency_ms"],
+            "sampled_at": snapshot["sampled_at"],
         }
+        if request.user.is_staff or request.user.is_superuser:
+            health_data["process"] = snapshot["process"]
+            if request.query_params.get("history") in ("1", "true"):
+                health_data["history"] = health_sampler.history()
         return Response(health_data, status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    """
+    Request metrics in the Prometheus text format, for scraping. Readable
+    with the METRICS_TOKEN bearer token or a staff session; without a token
+    configured, anyone may read them only while DEBUG is on.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    scraper = token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    if not (scraper or request.user.is_staff or (not token and settings.DEBUG)):
+        return HttpResponse(status=401)
+    return HttpResponse(request_metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.db import models
 from django.utils.text import slugify
+from MBP.slug_utils import allocate_slug
 import uuid
 # from django.contrib.auth.models import AbstractUser
 # from django.db import models
@@ -60,12 +61,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     def save(self, *args, **kwargs):
         if not self.slug:
             base_slug = slugify(self.full_name or self.email.split('@')[0])
-            slug = base_slug
-            count = 1
-            while User.objects.filter(slug=slug).exists():
-                slug = f"{base_slug}-{count}"
-                count += 1
-            self.slug = slug
+            self.slug = allocate_slug(User, base_slug)
             
         # self.is_active = self.is_email_verified and self.is_phone_verified
         super().save(*args, **kwargs)
@@ -1,3 +1,56 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from MBP.models import AppModel, PermissionType, Role, RoleModelPermission
+from MBP.permission_utils import clear_permission_cache
+
+from .models import User
+
+
+class UserSlugTest(TestCase):
+    def test_duplicate_names_get_numbered_slugs(self):
+        first = User.objects.create_user(email="john@example.com", full_name="John Doe")
+        second = User.objects.create_user(email="john.doe@example.com", full_name="John Doe")
+        third = User.objects.create_user(email="jd@example.com", full_name="John Doe")
+
+        self.assertEqual([first.slug, second.slug, third.slug], ["john-doe", "john-doe-1", "john-doe-2"])
+
+
+class PermissionManifestTest(TestCase):
+    def setUp(self):
+        clear_permission_cache()
+        self.role = Role.objects.create(name="Staff")
+        self.app_model = AppModel.objects.create(name="Task", verbose_name="Task", app_label="HRM")
+        self.read = PermissionType.objects.create(name="Read", code="r")
+        RoleModelPermission.objects.create(role=self.role, model=self.app_model, permission_type=self.read)
+        self.user = User.objects.create_user(
+            email="staff@example.com", password="s3cret-pass", full_name="Staff Member", role=self.role,
+            is_active=True, is_email_verified=True, is_phone_verified=True,
+        )
+        self.client = APIClient()
+
+    def test_login_embeds_the_manifest(self):
+        response = self.client.post("/api/login/", {"email": self.user.email, "password": "s3cret-pass"})
+        self.assertEqual(response.status_code, 200)
+        user = response.data["user"]
+        self.assertEqual(user["permissions"], [{"model_name": "Task", "permission": "r"}])
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get("/api/me/permissions/")
+        self.assertEqual(response["ETag"], user["permissions_etag"])
+        self.assertEqual(response.data["permissions"], user["permissions"])
+
+    def test_revalidation_returns_304_until_grants_change(self):
+        self.client.force_authenticate(self.user)
+        etag = self.client.get("/api/me/permissions/")["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/me/permissions/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        update = PermissionType.objects.create(name="Update", code="u")
+        RoleModelPermission.objects.create(role=self.role, model=self.app_model, permission_type=update)
+        response = self.client.get("/api/me/permissions/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data["permissions"]), 2)
@@ -1,5 +1,5 @@
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, LogoutView, LoginView, RegisterView, GoogleLogin, VerifyEmailView, VerifyOTPView, GeminiTextAPIView, VerifyEmailAndResetPasswordAPIView
+from .views import UserViewSet, LogoutView, LoginView, RegisterView, GoogleLogin, VerifyEmailView, VerifyOTPView, GeminiTextAPIView, VerifyEmailAndResetPasswordAPIView, MyPermissionsView
 from django.urls import path, include
 
 router = DefaultRouter()
@@ -10,6 +10,7 @@ urlpatterns = [
     path('api/register/', RegisterView.as_view(), name='register'),
     path('api/logout/', LogoutView.as_view(), name='logout'),
     path('api/login/', LoginView.as_view(), name='login'),
+    path('api/me/permissions/', MyPermissionsView.as_view(), name='my-permissions'),
     path("api/auth/google/", GoogleLogin.as_view(), name="google_login"),
     path("api/verify-email/<slug:slug>/", VerifyEmailView.as_view(), name="verify-email"),
     path("api/verify-otp/", VerifyOTPView.as_view(), name="verify-otp"),
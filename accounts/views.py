@@ -4,11 +4,13 @@ from rest_framework.decorators import action
 from django.contrib.auth import authenticate, logout, login
 from rest_framework.permissions import IsAuthenticated
 from MBP.permissions import HasModelPermission
-from MBP.models import Role, RoleModelPermission
+from MBP.models import Role
 from accounts.serializers import UserSerializer, RegisterUserSerializer, VerifyEmailAndResetPasswordSerializer
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from MBP.utils import log_audit
+from MBP.permission_utils import add_permission_claims, get_role_manifest
 from rest_framework.permissions import AllowAny
 from MBP.views import ProtectedModelViewSet
 from django.core.mail import send_mail
@@ -49,9 +51,10 @@ class UserViewSet(ProtectedModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        users = User.objects.select_related('role', 'created_by').order_by('-date_joined')
         if user.is_superuser:
-            return User.objects.all().order_by('-date_joined')
-        return User.objects.filter(created_by=user).order_by('-date_joined')
+            return users
+        return users.filter(created_by=user)
 
     @action(detail=True, methods=['patch'], url_path='assign-role', permission_classes=[HasModelPermission])
     def assign_role(self, request, slug=None):
@@ -218,7 +221,7 @@ class LoginView(APIView):
 
         # Step 1: Check if user exists
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.select_related("role").get(email=email)
         except User.DoesNotExist:
             return Response(
                 {"error": "Invalid credentials"},
@@ -266,6 +269,9 @@ class LoginView(APIView):
 
         # Step 6: Issue JWT
         refresh = RefreshToken.for_user(user)
+        access = refresh.access_token
+        if settings.PERMISSION_CLAIMS_IN_TOKEN:
+            add_permission_claims(access, user.role_id)
 
         # Step 7: Audit log
         log_audit(
@@ -276,27 +282,21 @@ class LoginView(APIView):
             details=f"{user.email} logged in"
         )
 
-        # Step 8: Role permissions
-        accessible_models = []
+        # Step 8: Role permissions (cached manifest, see MyPermissionsView)
         role = getattr(user, "role", None)
-        if role:
-            role_perms = RoleModelPermission.objects.filter(role=role)
-            for rp in role_perms:
-                accessible_models.append({
-                    "model_name": rp.model.name,
-                    "permission": rp.permission_type.code
-                })
+        permissions_etag, accessible_models = get_role_manifest(user.role_id)
 
         # Step 9: Ecommerce response
         return Response({
             "refresh": str(refresh),
-            "access": str(refresh.access_token),
+            "access": str(access),
             "user": {
                 "id": str(user.id),
                 "email": user.email,
                 "full_name": user.full_name,
                 "role": role.name if role else None,
                 "permissions": accessible_models,
+                "permissions_etag": permissions_etag,
                 "customer_slug": user.slug,  # ✅ THIS FIXES EVERYTHING
             }
         }, status=status.HTTP_200_OK)
@@ -318,7 +318,7 @@ class LoginView(APIView):
 
         # Step 1: Check if user exists
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.select_related("role").get(email=email)
         except User.DoesNotExist:
             return Response(
                 {"error": "Invalid credentials"},
@@ -365,6 +365,9 @@ class LoginView(APIView):
 
         # Step 6: Issue JWT tokens
         refresh = RefreshToken.for_user(user)
+        access = refresh.access_token
+        if settings.PERMISSION_CLAIMS_IN_TOKEN:
+            add_permission_claims(access, user.role_id)
 
         # Step 7: Audit log
         log_audit(
@@ -375,33 +378,43 @@ class LoginView(APIView):
             details=f"{user.email} logged in"
         )
 
-        # Step 8: Collect permissions for role
-        role = user.role
-        accessible_models = []
-        if role:
-            role_perms = RoleModelPermission.objects.filter(role=role)
-            for rp in role_perms:
-                accessible_models.append({
-                    "model_name": rp.model.name,
-                    "permission": rp.permission_type.code
-                })
+        # Step 8: Collect permissions for role (cached manifest, see MyPermissionsView)
+        permissions_etag, accessible_models = get_role_manifest(user.role_id)
 
        
         # 🔹 Step 10: Return complete response
         return Response({
             "refresh": str(refresh),
-            "access": str(refresh.access_token),
+            "access": str(access),
             "user": {
                 "email": user.email,
                 "full_name": user.full_name,
                 "role": user.role.name if user.role else None,
                 "permissions": accessible_models,
+                "permissions_etag": permissions_etag,
                 # "hotel_slug": hotel_slug,  # ✅ Added
                 # "restaurant_slug": restaurant_slug,
             },
         }, status=status.HTTP_200_OK)
         
                 
+class MyPermissionsView(APIView):
+    """
+    GET /api/me/permissions/ - the current user's permission manifest (the same
+    list returned at login). Send the ETag back as If-None-Match to get a 304
+    while the role's grants are unchanged.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        etag, permissions = get_role_manifest(request.user.role_id)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response({"permissions": permissions}, headers=headers)
+
+
 from rest_framework_simplejwt.tokens import TokenError, AccessToken
 from django.core.cache import cache
 import datetime
@@ -0,0 +1,373 @@
+"""
+Query-budget regression harness.
+
+Every route in carify/urls.py is either exercised here (ENDPOINTS) or listed
+in SKIPPED with the reason it is not. Each exercised endpoint is requested
+against the synthetic dataset from MBP/seed_utils.py at two sizes, and the
+harness fails when
+
+* its query count is higher on the larger dataset (the count grows with the
+  number of rows: an N+1), or
+* its query count is over the budget declared for it.
+
+Counts are taken on a warm request (the second of two), so per-process
+caches such as the permission matrices are counted once, not every time.
+Every request runs in a savepoint that is rolled back afterwards, so write
+endpoints see the same rows on both requests and leave nothing behind for
+the endpoints after them.
+
+Usage (from the repository root):
+
+    python -m benchmarks.query_budget                     # 10 and 40 users
+    python -m benchmarks.query_budget --small 20 --large 100
+    python -m benchmarks.query_budget --json query_budget.json
+
+The run uses a throwaway test database, so it never touches db.sqlite3 or
+the benchmark database. The same check runs in the test suite, on smaller
+datasets (MBP.tests.QueryBudgetTest). A new route has to be added to
+ENDPOINTS or SKIPPED, or the run fails.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from contextlib import redirect_stdout
+from datetime import date, time, timedelta
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.urls import URLPattern, URLResolver, get_resolver  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from accounts.models import User  # noqa: E402
+from HRM.models import Attendance, Leave, Profile, Task  # noqa: E402
+from MBP.models import AppModel, AuditLog, PermissionType, Role, RoleModelPermission  # noqa: E402
+from MBP.health_utils import health_sampler  # noqa: E402
+from MBP.permission_utils import clear_permission_cache  # noqa: E402
+
+from MBP.seed_utils import BENCH_PASSWORD, seed  # noqa: E402
+
+# route -> declared budget and how to request it. "path" and the strings in
+# "data" and "headers" are formatted with the fixture values from fixtures() ("path"
+# defaults to the route itself), "as" is the requesting user: "admin" (a
+# superuser), "member" (a seeded user who owns attendance rows and tasks),
+# "present" (a seeded user who checked in today and has not checked out) or
+# "owner" (an Admin-role user who created two of the seeded users).
+ENDPOINTS = {
+    "api/": {"budget": 0},
+    "metrics": {"budget": 0, "headers": {"Authorization": "Bearer budget-scraper"}},
+
+    # MBP
+    "api/roles/": {"budget": 1},
+    "api/roles/<slug>/": {"budget": 1, "path": "api/roles/{role}/"},
+    "api/appmodels/": {"budget": 1},
+    "api/appmodels/<slug>/": {"budget": 1, "path": "api/appmodels/{app_model}/"},
+    "api/permission-types/": {"budget": 1},
+    "api/permission-types/<slug>/": {"budget": 1, "path": "api/permission-types/{permission_type}/"},
+    "api/role-permissions/": {"budget": 1},
+    "api/role-permissions/<slug>/": {"budget": 1, "path": "api/role-permissions/{grant}/"},
+    "api/role-permissions-bulk/": {"budget": 1},
+    "api/role-permissions-bulk/<pk>/": {"budget": 1, "path": "api/role-permissions-bulk/{grant_pk}/"},
+    "api/logs/": {"budget": 1},
+    "api/logs/<pk>/": {"budget": 1, "path": "api/logs/{log}/"},
+    "api/logs/activity/": {"budget": 1},
+    "api/logs/export/": {"budget": 1, "path": "api/logs/export/?output=csv"},
+    "api/logs/recent/": {"budget": 0},
+    "api/logs/system-health/": {"budget": 0},
+    "api/role-permissions/bulk-assign/": {
+        "budget": 18, "method": "post",
+        "data": {"permissions": [
+            {"role": "{role}", "model": "{app_model}", "permission_type": "{permission_type}"},
+        ]},
+    },
+    "api/role-permissions-bulk/create/": {
+        "budget": 18, "method": "post",
+        "data": {"role_name": "{role_name}", "permissions": [
+            {"model_slug": "{app_model}", "permission_slugs": ["{permission_code}"]},
+        ]},
+    },
+    "api/role-permissions-bulk/update/": {
+        "budget": 20, "method": "put",
+        "data": {"role_name": "{role_name}", "permissions": [
+            {"model_slug": "{app_model}", "permission_slugs": ["{permission_code}"]},
+        ]},
+    },
+    "api/role-permissions-bulk/delete/": {
+        "budget": 10, "method": "delete", "data": {"slugs": ["{grant}"]},
+    },
+
+    # accounts
+    "api/users/": {"budget": 1},
+    "api/users/<slug>/": {"budget": 1, "path": "api/users/{user}/"},
+    "api/users/<slug>/assign-role/": {
+        "budget": 17, "method": "patch", "path": "api/users/{user}/assign-role/",
+        "data": {"role_slug": "{other_role}"},
+    },
+    "api/users/delete-my-users/": {"budget": 23, "method": "delete", "as": "owner"},
+    "api/me/permissions/": {"budget": 0},
+    "api/login/": {
+        "budget": 8, "method": "post", "as": None,
+        "data": {"email": "{member_email}", "password": BENCH_PASSWORD},
+    },
+
+    # HRM
+    "myattendance/": {"budget": 1, "as": "member"},
+    "allattendance/": {"budget": 1},
+    "attendance/by-date/": {"budget": 1, "path": "attendance/by-date/?date={day}"},
+    "attendance/month/": {"budget": 1, "path": "attendance/month/?month={month}"},
+    "attendance/summary/": {"budget": 2, "path": "attendance/summary/?month={month}"},
+    "attendance/live-status/": {"budget": 1},
+    "attendance/status/by-date/": {"budget": 2, "path": "attendance/status/by-date/?date={day}"},
+    "attendance/export/month/": {"budget": 1, "path": "attendance/export/month/?month={month}"},
+    "attendance/export/excel/": {
+        "budget": 2,
+        "path": "attendance/export/excel/?user_id={user_id}&year={year}&month={month_number}",
+    },
+    "dashboard/": {"budget": 12},
+    "checkin/": {"budget": 5, "method": "post", "as": "member"},
+    "checkout/": {"budget": 3, "method": "post", "as": "present", "data": {"project": "Budget"}},
+    "leave/request/": {
+        "budget": 1, "method": "post", "as": "member",
+        "data": {"date": "{future}", "leave_type": "Casual"},
+    },
+    "leave/update/<int:leave_id>/": {
+        "budget": 2, "method": "patch", "path": "leave/update/{leave}/", "data": {"status": "Approved"},
+    },
+    "holiday/create/": {"budget": 2, "method": "post", "data": {"date": "{future}", "name": "Budget day"}},
+    "profiles/<slug:slug>/": {"budget": 1, "path": "profiles/{profile}/"},
+    "tasks/create/": {
+        "budget": 3, "method": "post",
+        "data": {"title": "Budget", "assigned_to": "{staff_email}", "due_date": "{future}"},
+    },
+    "tasks/update/<str:task_uid>/": {
+        "budget": 3, "method": "patch", "path": "tasks/update/{task}/", "data": {"status": "Completed"},
+    },
+    "tasks/my/": {"budget": 1, "as": "member"},
+    "tasks/all/": {"budget": 1},
+}
+
+# route -> why it is not exercised
+SKIPPED = {
+    "api/logs/live/": "server-sent event stream; holds the connection open",
+    "api/register/": "sends email",
+    "api/logout/": "needs a real bearer token and the simplejwt blacklist app, which is not installed",
+    "api/auth/google/": "calls Google",
+    "api/verify-email/<slug:slug>/": "one-time email link",
+    "api/verify-otp/": "one-time code",
+    "api/gemini/generate/": "calls the Gemini API",
+    "api/verify-email-reset-password/<slug:slug>/": "one-time email link",
+    "delete-user/<str:user_uid>/<str:uid>/": "needs a confirmation code (Profile.delete_code) that no user has",
+    "ckeditor/upload/": "third-party",
+    "ckeditor/browse/": "third-party",
+    "swagger/": "schema generation",
+    "redoc/": "schema generation",
+    "media/<path>": "static files (DEBUG only)",
+}
+
+_GROUP = re.compile(r"\(\?P<(\w+)>[^)]*\)")
+
+
+def _readable(pattern):
+    return _GROUP.sub(r"<\1>", pattern.replace("^", "").replace("$", ""))
+
+
+def all_routes(patterns=None, prefix=""):
+    """Every routed URL pattern, readable, without format-suffix variants."""
+    routes = []
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        route = prefix + _readable(str(pattern.pattern))
+        if isinstance(pattern, URLResolver):
+            if route == "admin/":
+                continue
+            routes.extend(all_routes(pattern.url_patterns, route))
+        elif isinstance(pattern, URLPattern) and "format" not in pattern.pattern.regex.groupindex:
+            if route not in routes:
+                routes.append(route)
+    return routes
+
+
+def unlisted_routes():
+    return [route for route in all_routes() if route not in ENDPOINTS and route not in SKIPPED]
+
+
+def fixtures(member):
+    # Primary keys are UUIDs, so rows are picked by name or slug to send the
+    # same payloads at both sizes. Staff only holds "r" grants, so granting it
+    # "c" always creates rows (and the bulk update also removes its "r").
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+    grant = RoleModelPermission.objects.order_by("slug").first()
+    role = Role.objects.get(name="Staff")
+    permission_type = PermissionType.objects.get(code="c")
+    return {
+        "role": role.slug,
+        "role_name": role.name,
+        "other_role": Role.objects.exclude(pk=member.role_id).order_by("name").first().slug,
+        "app_model": AppModel.objects.order_by("slug").first().slug,
+        "permission_type": permission_type.slug,
+        "permission_code": permission_type.code,
+        "grant": grant.slug,
+        "grant_pk": grant.pk,
+        "log": AuditLog.objects.order_by("pk").first().pk,
+        "user": member.slug,
+        "user_id": member.pk,
+        "member_email": member.email,
+        "staff_email": User.objects.filter(role=role).order_by("email").first().email,
+        "profile": Profile.objects.get(user=member).slug,
+        "leave": Leave.objects.order_by("pk").first().pk,
+        "task": Task.objects.order_by("uid").first().uid,
+        "day": yesterday.isoformat(),
+        "month": yesterday.strftime("%Y-%m"),
+        "year": yesterday.year,
+        "month_number": yesterday.month,
+        "future": (today + timedelta(days=60)).isoformat(),
+    }
+
+
+def _fill(value, values):
+    if isinstance(value, str):
+        return value.format(**values)
+    if isinstance(value, dict):
+        return {key: _fill(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, values) for item in value]
+    return value
+
+
+def _request(client, spec, values):
+    method = spec.get("method", "get")
+    path = "/" + spec.get("path", spec["route"]).format(**values)
+    data = _fill(spec.get("data", {}), values)
+    headers = _fill(spec.get("headers", {}), values)
+    if data:
+        return getattr(client, method)(path, data, format="json", headers=headers)
+    return getattr(client, method)(path, headers=headers)
+
+
+def _isolated(client, spec, values):
+    """One request (and its streamed body) in a savepoint that is rolled back."""
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as captured:
+            response = _request(client, spec, values)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        transaction.set_rollback(True)
+    return response, len(captured)
+
+
+def measure(users, days):
+    """``{route: (status code, queries)}`` for every endpoint on a fresh dataset of this size."""
+    results = {}
+    # Audit rows are written in the request, so their queries count too. The
+    # permission version is re-read when a write bumps it, not when a clock
+    # runs out, so counts do not depend on how fast the run is. /metrics is
+    # read with its bearer token, as a scraper would.
+    with override_settings(AUDIT_LOG_ASYNC=False, PERMISSION_VERSION_TTL=3600, METRICS_TOKEN="budget-scraper"), \
+            transaction.atomic():
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            people = seed(users=users, days=days)
+        clear_permission_cache()
+        member, present = people[0], people[1]
+        admin = User.objects.create_superuser(email="budget-admin@bench.local", password=BENCH_PASSWORD)
+        Attendance.objects.create(user=present, date=date.today(), check_in=time(9, 0), status="Present")
+        Leave.objects.create(user=member, date=date.today() + timedelta(days=7), leave_type="Sick")
+        owner = User.objects.create_user(
+            email="budget-owner@bench.local", password=BENCH_PASSWORD, role=Role.objects.get(name="Admin")
+        )
+        User.objects.filter(pk__in=[person.pk for person in people[2:4]]).update(created_by=owner)
+        values = fixtures(member)
+        # system-health answers 503 until the sampler thread's first snapshot
+        health_sampler.sample()
+
+        for route, spec in ENDPOINTS.items():
+            spec = {"route": route, **spec}
+            client = APIClient(raise_request_exception=False)
+            actors = {"admin": admin, "member": member, "present": present, "owner": owner}
+            actor = actors.get(spec.get("as", "admin"))
+            if actor is not None:
+                client.force_authenticate(actor)
+
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                _isolated(client, spec, values)  # warm per-process caches
+                response, queries = _isolated(client, spec, values)
+            results[route] = (response.status_code, queries)
+
+        transaction.set_rollback(True)
+    clear_permission_cache()
+    return results
+
+
+def run(small=10, large=40, days=3):
+    """
+    Measure both sizes. Returns ``(rows, problems)``: one row per endpoint
+    and a list of human-readable budget violations.
+    """
+    before, after = measure(small, days), measure(large, days)
+    rows, problems = [], []
+    for route in ENDPOINTS:
+        budget = ENDPOINTS[route]["budget"]
+        (small_status, small_queries), (large_status, large_queries) = before[route], after[route]
+        rows.append({
+            "route": route,
+            "status": large_status,
+            "budget": budget,
+            "queries_small": small_queries,
+            "queries_large": large_queries,
+        })
+        if large_status >= 500 or small_status >= 500:
+            problems.append(f"{route}: server error ({small_status}/{large_status})")
+        if large_queries > small_queries:
+            problems.append(f"{route}: {small_queries} -> {large_queries} queries as rows grow")
+        if max(small_queries, large_queries) > budget:
+            problems.append(f"{route}: {max(small_queries, large_queries)} queries, budget {budget}")
+
+    problems.extend(f"{route}: not in ENDPOINTS or SKIPPED" for route in unlisted_routes())
+    return rows, problems
+
+
+def format_table(rows, small, large):
+    lines = [f"{'endpoint':45} {'status':>6} {'budget':>6} {f'q@{small}':>7} {f'q@{large}':>7}"]
+    for row in rows:
+        lines.append(
+            f"{row['route']:45} {row['status']:>6} {row['budget']:>6} "
+            f"{row['queries_small']:>7} {row['queries_large']:>7}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--small", type=int, default=10, help="Users in the small dataset")
+    parser.add_argument("--large", type=int, default=40, help="Users in the large dataset")
+    parser.add_argument("--days", type=int, default=3, help="Days of attendance history per user")
+    parser.add_argument("--json", help="Also write the table to this JSON file")
+    args = parser.parse_args()
+
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        rows, problems = run(args.small, args.large, args.days)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(format_table(rows, args.small, args.large))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump({"small": args.small, "large": args.large, "endpoints": rows}, fh, indent=2)
+    if problems:
+        print("\nOver budget:\n  " + "\n  ".join(problems))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
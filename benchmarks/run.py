@@ -0,0 +1,251 @@
+"""
+Microbenchmarks for the request hot paths.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run                      # seed on first run, run every case
+    python -m benchmarks.run --only serialize     # cases whose name contains "serialize"
+    python -m benchmarks.run --reseed --users 1000
+    python -m benchmarks.run --json bench_output.json
+
+Cases run against benchmarks/bench.sqlite3 (override with BENCH_DB) seeded
+with deterministic synthetic data. Each case reports throughput, mean latency,
+database queries per op, and the net tracemalloc blocks and peak KiB per op.
+Cases that write run inside a transaction that is rolled back afterwards, so
+the database stays identical between runs.
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from types import SimpleNamespace
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.apps import apps  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from accounts.models import User  # noqa: E402
+from accounts.views import LoginView  # noqa: E402
+from HRM.models import Attendance  # noqa: E402
+from MBP.models import AppModel, AuditLog, PermissionType, Role, RoleModelPermission  # noqa: E402
+from MBP.permissions import HasModelPermission  # noqa: E402
+from MBP.utils import serialize_instance  # noqa: E402
+
+from MBP.seed_utils import BENCH_PASSWORD, seed  # noqa: E402
+
+CASES = {}
+
+
+def case(name):
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def quiet():
+    # Keep debug print()s on the measured paths out of the report
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        yield
+
+
+@contextmanager
+def rollback():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+# ----------------------------------------------------------------------
+# Cases: each yields a zero-argument callable performing one operation
+# ----------------------------------------------------------------------
+@case("has_permission")
+def bench_has_permission(ctx):
+    request = SimpleNamespace(user=ctx.staff, auth=None)
+    view = SimpleNamespace(model_name="Attendance", permission_code="r")
+    permission = HasModelPermission()
+    yield lambda: permission.has_permission(request, view)
+
+
+def _serialize_case(model, queryset):
+    def bench(ctx):
+        instance = queryset().first()
+        yield lambda: serialize_instance(instance)
+    case(f"serialize_instance[{model.__name__}]")(bench)
+
+
+_serialize_case(Attendance, lambda: Attendance.objects.select_related("user"))
+_serialize_case(User, lambda: User.objects.select_related("role", "created_by"))
+_serialize_case(AuditLog, lambda: AuditLog.objects.select_related("user"))
+_serialize_case(
+    RoleModelPermission,
+    lambda: RoleModelPermission.objects.select_related("role", "model", "permission_type"),
+)
+
+
+@case("serialize_instance[every model]")
+def bench_serialize_all(ctx):
+    # One instance of each installed model that has rows, relations preloaded
+    instances = []
+    for model in apps.get_models():
+        relations = [f.name for f in model._meta.fields if f.many_to_one or f.one_to_one]
+        instance = model._default_manager.select_related(*relations).first()
+        if instance is not None:
+            instances.append(instance)
+
+    def op():
+        for instance in instances:
+            serialize_instance(instance)
+    yield op
+
+
+@case("Attendance.save")
+def bench_attendance_save(ctx):
+    attendance = Attendance.objects.filter(user=ctx.staff).first()
+    with rollback():
+        minutes = itertools.cycle(range(60))
+
+        def op():
+            attendance.check_out = attendance.check_out.replace(minute=next(minutes))
+            attendance.save()
+        yield op
+
+
+@case("User.save[slug]")
+def bench_user_save(ctx):
+    # Every new user shares a popular name, so each save needs a fresh suffix
+    with rollback():
+        counter = itertools.count()
+        yield lambda: User(email=f"popular{next(counter)}@bench.local", full_name="Aarav Sharma").save()
+
+
+@case("RoleModelPermission.save[slug]")
+def bench_permission_save(ctx):
+    with rollback():
+        app_model = AppModel.objects.order_by("name").first()
+        perm_type = PermissionType.objects.get(code="r")
+        counter = itertools.count()
+
+        def op():
+            role = Role.objects.create(name=f"Bench Role {next(counter)}")
+            RoleModelPermission(role=role, model=app_model, permission_type=perm_type).save()
+        yield op
+
+
+@case("LoginView.post")
+def bench_login(ctx):
+    factory = APIRequestFactory()
+    view = LoginView.as_view()
+    payload = {"email": ctx.staff.email, "password": BENCH_PASSWORD}
+    with rollback():
+        def op():
+            response = view(factory.post("/api/login/", payload, format="json"))
+            assert response.status_code == 200, response.data
+        yield op
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+def measure(op, iterations, sample):
+    for _ in range(min(sample, iterations)):
+        op()
+
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(sample):
+            op()
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    for _ in range(sample):
+        op()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        op()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "ops_per_sec": iterations / elapsed,
+        "mean_us": elapsed / iterations * 1_000_000,
+        "queries_per_op": len(queries) / sample,
+        "blocks_per_op": blocks / sample,
+        "peak_kib": peak / 1024,
+    }
+
+
+def prepare(args):
+    db_path = settings.DATABASES["default"]["NAME"]
+    if args.reseed and os.path.exists(db_path):
+        os.remove(db_path)
+
+    with quiet():
+        call_command("migrate", verbosity=0)
+    if not User.objects.exists():
+        print(f"Seeding {db_path} with {args.users} users x {args.days} days ...")
+        with quiet():
+            seed(users=args.users, days=args.days, seed=args.seed)
+
+    staff = User.objects.filter(role__name="Staff").order_by("email").first()
+    return SimpleNamespace(staff=staff)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="Run only cases whose name contains this text")
+    parser.add_argument("--iterations", type=int, default=500, help="Timed iterations per case")
+    parser.add_argument("--sample", type=int, default=50, help="Iterations used for query/allocation counts")
+    parser.add_argument("--users", type=int, default=200, help="Users to seed")
+    parser.add_argument("--days", type=int, default=30, help="Days of attendance history to seed")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the synthetic data")
+    parser.add_argument("--reseed", action="store_true", help="Recreate the benchmark database")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    ctx = prepare(args)
+
+    results = []
+    print(f"{'case':40} {'ops/sec':>12} {'mean µs':>10} {'queries/op':>11} {'blocks/op':>10} {'peak KiB':>9}")
+    for name, bench in CASES.items():
+        if args.only and args.only not in name:
+            continue
+        with quiet():
+            fixture = bench(ctx)
+            op = next(fixture)
+            try:
+                result = {"case": name, **measure(op, args.iterations, args.sample)}
+            finally:
+                fixture.close()
+        results.append(result)
+        print(
+            f"{name:40} {result['ops_per_sec']:>12,.0f} {result['mean_us']:>10.1f} "
+            f"{result['queries_per_op']:>11.2f} {result['blocks_per_op']:>10.1f} {result['peak_kib']:>9.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Settings for the benchmark suite: the project settings pointed at a separate
+on-disk SQLite database so runs never touch db.sqlite3.
+"""
+import os
+
+from carify.settings import *  # noqa: F401,F403
+from carify.settings import BASE_DIR
+
+DEBUG = False
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.getenv("BENCH_DB", BASE_DIR / "benchmarks" / "bench.sqlite3"),
+    }
+}
+
+# The hot paths are measured, not PBKDF2: a fast hasher keeps LoginView
+# numbers about this project's code.
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
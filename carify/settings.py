@@ -58,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'MBP.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -209,6 +210,54 @@ SIMPLE_JWT = {
     "TOKEN_BLACKLIST_ENABLED": True,
 }
 
+# Embed each role's (model, CRUD) grants in access tokens so HasModelPermission
+# can authorize from the token alone, with no query even in a worker that has
+# not compiled the role's matrix (see MBP.permission_utils). Claims stop
+# counting once the permission version moves, within PERMISSION_VERSION_TTL.
+PERMISSION_CLAIMS_IN_TOKEN = False
+# Each process re-reads the shared permission version (MBP.PermissionVersion)
+# at most this often, so grant changes made by another worker take effect
+# within this many seconds; checks in between run no query
+PERMISSION_VERSION_TTL = 2.0  # seconds
+
+# Audit logs are queued and bulk-inserted by a background thread (see
+# MBP.audit_utils). AUDIT_LOG_ASYNC=0 in the environment writes them
+# synchronously, in the request's transaction; tests that read the rows back
+# switch it off with override_settings.
+AUDIT_LOG_ASYNC = os.environ.get("AUDIT_LOG_ASYNC", "1") != "0"
+AUDIT_LOG_BATCH_SIZE = 100
+AUDIT_LOG_FLUSH_INTERVAL = 1.0  # seconds
+# "full" stores both snapshots of an update. "diff" stores only the changed
+# fields: the log detail view rebuilds the snapshots, but the list and
+# /export return old_data and new_data as null for those updates
+AUDIT_LOG_UPDATE_MODE = os.environ.get("AUDIT_LOG_UPDATE_MODE", "full")
+# In-process buffer of this worker's recent audit events behind
+# /api/logs/recent/ (which falls back to the table when it holds too few).
+# The /api/logs/live/ SSE feed polls the AuditLog table every
+# AUDIT_FEED_POLL_SECONDS; each connection holds a worker, so it is closed
+# (and the client reconnects) after AUDIT_FEED_STREAM_SECONDS
+AUDIT_FEED_SIZE = 500
+AUDIT_FEED_POLL_SECONDS = 2.0
+AUDIT_FEED_STREAM_SECONDS = 20
+# Incremental CSV exports (export_csv --incremental) keep their AuditLog
+# watermark this far behind the newest entries, so ids committed out of
+# order by slow transactions are still picked up by the next run
+AUDIT_EXPORT_LAG_SECONDS = 300
+
+# Background sampler behind /api/logs/system-health/ (see MBP.health_utils)
+HEALTH_SAMPLE_INTERVAL = 5.0  # seconds
+HEALTH_HISTORY_SIZE = 120
+
+# Per-view request metrics (see MBP.middleware), served at /metrics for
+# Prometheus, which sends METRICS_TOKEN as "Authorization: Bearer <token>".
+# Staff sessions can always read them; with no token set, everyone else can
+# only while DEBUG is on.
+METRICS_ENABLED = True
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+# `manage.py archive_audit_logs` moves older rows into monthly gzip files here
+AUDIT_LOG_RETENTION_DAYS = 90
+AUDIT_LOG_ARCHIVE_DIR = BASE_DIR / "audit_archive"
+
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'